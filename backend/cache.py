@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from threading import Lock
+import json
+
+
+class result_cache:
+    def __init__(self, maxSize):
+        """
+        Bounded LRU cache of encoded responses
+        ===
+        - maxSize - maximum total size of cached values in bytes
+        """
+        self.maxSize = maxSize
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return self.items[key][0]
+
+
+    def set(self, key, value, size=None):
+        """
+        Function that adds value to the cache
+        ===
+        - key - cache key
+        - value - cached value
+        - size - size of the value in bytes (default = len(value))
+        """
+        size = len(value) if size is None else size
+        with self.lock:
+            if size > self.maxSize:
+                return
+            if key in self.items:
+                self.size -= self.items.pop(key)[1]
+            self.items[key] = (value, size)
+            self.size += size
+            while self.size > self.maxSize:
+                self.size -= self.items.popitem(last=False)[1][1]
+                self.evictions += 1
+
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'items': len(self.items), 'size': self.size, 'maxSize': self.maxSize}
+
+
+def cache_key(data, variant=None):
+    """
+    Function that makes the cache key from normalized request data (seed included)
+    ===
+    - data - normalized request data
+    - variant - representation of the cached value (e.g. content type, None = JSON)
+    """
+    key = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return key if variant is None else variant + ';' + key
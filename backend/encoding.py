@@ -0,0 +1,120 @@
+from django.core.serializers.json import DjangoJSONEncoder
+import numpy as np
+import struct
+import gzip
+import zlib
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+JSON = 'application/json'
+FLOAT32 = 'application/x-float32'
+MSGPACK = 'application/msgpack'
+
+ALIASES = {'application/octet-stream': FLOAT32, 'application/x-msgpack': MSGPACK}
+
+# compressing smaller bodies does not pay off
+MIN_COMPRESS_SIZE = 200
+
+
+def accepted(header):
+    """
+    Function that parses Accept / Accept-Encoding header
+    ===
+    - header - header value
+    - ----
+    Returns list of accepted values in order of preference (q=0 values are skipped)
+    """
+    items = []
+    for i, part in enumerate(header.split(',')):
+        name, *params = [o.strip() for o in part.split(';')]
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            items.append((-q, i, name.lower()))
+    return [o[2] for o in sorted(items)]
+
+
+def negotiate(request):
+    """
+    Function that chooses content type of the result (JSON by default)
+    ===
+    - request - django request
+    """
+    for name in accepted(request.headers.get('Accept', '')):
+        name = ALIASES.get(name, name)
+        if name == FLOAT32 or (name == MSGPACK and msgpack is not None):
+            return name
+        if name in (JSON, 'application/*', '*/*'):
+            return JSON
+    return JSON
+
+
+def encode(data, contentType):
+    """
+    Function that encodes response data
+    ===
+    - data - response dict with result rows (list of lists)
+    - contentType - result of negotiate
+    - ----
+    float32 body is little-endian uint32 rows, uint32 columns and rows x columns float32 values
+    (shorter rows are padded with NaN), other fields of data are not included
+    """
+    if contentType == FLOAT32:
+        rows = data['result']
+        columns = max((len(o) for o in rows), default=0)
+        array = np.full(shape=(len(rows), columns), fill_value=np.nan, dtype='<f4')
+        for i, row in enumerate(rows):
+            array[i, :len(row)] = row
+        return struct.pack('<II', *array.shape) + array.tobytes()
+    if contentType == MSGPACK:
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+def decode(content, contentType):
+    """
+    Function that decodes response body made by encode (for clients and tests)
+    ===
+    - content - response body
+    - contentType - content type of the response
+    """
+    if contentType == FLOAT32:
+        rows, columns = struct.unpack('<II', content[:8])
+        return {'result': np.frombuffer(content, dtype='<f4', offset=8).reshape(rows, columns)}
+    if contentType == MSGPACK:
+        return msgpack.unpackb(content, raw=False)
+    return json.loads(content)
+
+
+def compress(request, response):
+    """
+    Function that compresses response with gzip or deflate if client accepts it
+    ===
+    - request - django request
+    - response - django response (not streaming)
+    """
+    response['Vary'] = 'Accept, Accept-Encoding'
+    if response.has_header('Content-Encoding') or len(response.content) < MIN_COMPRESS_SIZE:
+        return response
+
+    for name in accepted(request.headers.get('Accept-Encoding', '')):
+        if name == 'gzip':
+            response.content = gzip.compress(response.content)
+        elif name == 'deflate':
+            response.content = zlib.compress(response.content)
+        else:
+            continue
+        response['Content-Encoding'] = name
+        response['Content-Length'] = str(len(response.content))
+        break
+    return response
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.jobs.shards import load_spec, run_shards, merge_shards, shard_state
+
+
+def shard_list(text, count):
+    # "0,3,5-7" -> [0, 3, 5, 6, 7]
+    shards = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        shards += range(int(first), int(last or first) + 1)
+    if any(o < 0 or o >= count for o in shards):
+        raise CommandError(f'shards must be from 0 to {count - 1}')
+    return sorted(set(shards))
+
+
+class Command(BaseCommand):
+    help = 'Generates a CSV dataset (prefix + save_to_param row of every model) from a spec file in resumable shards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('spec', help='JSON spec file (see backend.jobs.shards.load_spec)')
+        parser.add_argument('path', help='dataset directory, an interrupted dataset is continued')
+        parser.add_argument('--shards', default=None, help='shards of this machine, for example 0-3,8 (all by default)')
+        parser.add_argument('--workers', type=int, default=settings.GENERATION_WORKERS, help='number of worker processes')
+        parser.add_argument('--no-merge', action='store_true', help='do not merge shards after generation')
+        parser.add_argument('--merge-only', action='store_true', help='only merge finished shards')
+
+    def handle(self, *args, **options):
+        try:
+            spec = load_spec(options['spec'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise CommandError(f'bad spec: {type(e).__name__}: {e}')
+
+        path = options['path']
+        shards = shard_list(options['shards'], spec['shards']) if options['shards'] else list(range(spec['shards']))
+
+        if not options['merge_only']:
+            try:
+                for shard, rows, generated in run_shards(path, spec, shards, options['workers']):
+                    self.stdout.write(f'shard {shard}: {rows} rows ({generated} new chunks)')
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        if options['no_merge']:
+            return
+
+        # a machine with a part of the shards does not merge, shard files are merged where all of them are copied
+        if options['shards'] and not options['merge_only'] and any(not shard_state(path, o)['done'] for o in range(spec['shards'])):
+            self.stdout.write('not all shards are finished, merge skipped')
+            return
+
+        try:
+            manifest = merge_shards(path, spec)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"{manifest['rows']} rows saved to {manifest['output']} (sha256 {manifest['sha256'][:12]})"))
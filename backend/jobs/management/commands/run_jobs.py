@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+import socket
+import os
+
+from backend.jobs.runner import run_jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs queued generation jobs in local worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.GENERATION_WORKERS, help='number of worker processes')
+        parser.add_argument('--stale', type=float, default=300, help='seconds after which running job without progress is taken again')
+        parser.add_argument('--poll', type=float, default=1.0, help='seconds between checks of the queue')
+        parser.add_argument('--once', action='store_true', help='exit when there are no queued jobs')
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(f'worker {worker} with {options["workers"]} processes')
+        run_jobs(worker, options['workers'], options['stale'], options['once'], options['poll'])
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generation_job',
+            name='crashes',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.db import models
+import json
+import zlib
+
+
+class generation_job(models.Model):
+    """
+    Generation of many models that is made by run_jobs workers chunk by chunk
+    ===
+    - params - normalized layer_models parameters (without N and seed)
+    - seed - seed of the job (chunk seeds are made from it)
+    - total - number of models
+    - chunkSize - number of models in one chunk
+    - completed - number of generated models
+    - heartbeat - last time the worker reported progress (stale jobs are taken by other workers)
+    - crashes - number of times a worker process died while making the job (see settings.JOB_MAX_CRASHES)
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    params = models.JSONField()
+    seed = models.BigIntegerField()
+    total = models.IntegerField()
+    chunkSize = models.IntegerField()
+    completed = models.IntegerField(default=0)
+    status = models.CharField(max_length=16, default=QUEUED, db_index=True)
+    error = models.TextField(blank=True, default='')
+    worker = models.CharField(max_length=128, blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    crashes = models.IntegerField(default=0)
+
+    def chunk_count(self):
+        return -(-self.total // self.chunkSize)
+
+    def chunk_models(self, index):
+        return min(self.chunkSize, self.total - index * self.chunkSize)
+
+    def state(self):
+        return {'id': self.id, 'status': self.status, 'completed': self.completed, 'total': self.total,
+                'chunkSize': self.chunkSize, 'chunks': self.chunk_count(), 'readyChunks': self.chunks.count(),
+                'error': self.error}
+
+
+class job_chunk(models.Model):
+    """
+    save_to_param rows of one chunk of the job (zlib compressed JSON)
+    """
+    job = models.ForeignKey(generation_job, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField()
+    rows = models.BinaryField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['job', 'index'], name='unique_job_chunk')]
+
+    def result(self):
+        return json.loads(zlib.decompress(self.rows))
@@ -0,0 +1,161 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from datetime import timedelta
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+import numpy as np
+import json
+import time
+import zlib
+
+from backend.jobs.models import generation_job, job_chunk
+from backend.models_genearateor.main import layer_models
+
+
+def chunk_seed(seed, index):
+    """
+    Function that makes seed of the chunk (chunks do not depend on each other, so they can be made again)
+    ===
+    - seed - seed of the job
+    - index - index of the chunk
+    """
+    return int(np.random.SeedSequence([seed, index]).generate_state(1)[0])
+
+
+def generate_chunk(params, seed, index, count):
+    """
+    Function that generates one chunk in a worker process
+    ===
+    - params - layer_models parameters (without N and seed)
+    - seed - seed of the job
+    - index - index of the chunk
+    - count - number of models in the chunk
+    - ----
+    Returns (index, count, zlib compressed JSON rows)
+    """
+    rows = layer_models(N=count, seed=chunk_seed(seed, index), **params).save_to_param(skipLast=False, step=1)
+    return index, count, zlib.compress(json.dumps(rows).encode())
+
+
+def claim_job(worker, stale):
+    """
+    Function that takes the oldest queued job (or running job without heartbeat for stale seconds)
+    ===
+    - worker - name of the worker
+    - stale - seconds after which running job is taken by another worker
+    - ----
+    Returns job or None
+    """
+    while True:
+        now = timezone.now()
+        job = (generation_job.objects
+               .filter(Q(status=generation_job.QUEUED) | Q(status=generation_job.RUNNING, heartbeat__lt=now - timedelta(seconds=stale)))
+               .order_by('id').first())
+        if job is None:
+            return None
+
+        # update succeeds only in one worker, the others look for the next job
+        taken = (generation_job.objects
+                 .filter(id=job.id, status=job.status, heartbeat=job.heartbeat)
+                 .update(status=generation_job.RUNNING, worker=worker, heartbeat=now))
+        if taken:
+            job.refresh_from_db()
+            return job
+
+
+def run_job(job, pool, workers):
+    """
+    Function that generates missing chunks of the job and saves them one by one
+    ===
+    - job - claimed job
+    - pool - process pool
+    - workers - number of chunks that are generated at the same time
+    - ----
+    Error in generate_chunk fails the job. If a pool process dies (OOM kill, segfault), the job is
+    queued again (failed after settings.JOB_MAX_CRASHES deaths) and BrokenProcessPool is raised,
+    so that run_jobs makes a new pool
+    """
+    ready = set(job.chunks.values_list('index', flat=True))
+    missing = [o for o in range(job.chunk_count()) if o not in ready]
+    job.completed = sum(job.chunk_models(o) for o in ready)
+
+    pending = set()
+    try:
+        while missing or pending:
+            while missing and len(pending) < workers:
+                index = missing.pop(0)
+                pending.add(pool.submit(generate_chunk, job.params, job.seed, index, job.chunk_models(index)))
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    index, count, rows = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    fail(job, pending, f'{type(e).__name__}: {e}')
+                    return job
+                try:
+                    with transaction.atomic():
+                        job_chunk.objects.create(job=job, index=index, rows=rows)
+                        job.completed += count
+                        job.heartbeat = timezone.now()
+                        job.save(update_fields=['completed', 'heartbeat'])
+                except IntegrityError:
+                    # chunk was saved by a worker that owned the job before
+                    continue
+    except BrokenProcessPool:
+        for future in pending:
+            future.cancel()
+        job.crashes += 1
+        if job.crashes >= settings.JOB_MAX_CRASHES:
+            job.status = generation_job.FAILED
+            job.error = f'worker process died {job.crashes} times'
+        else:
+            job.status = generation_job.QUEUED
+        job.save(update_fields=['status', 'error', 'crashes'])
+        raise
+
+    job.status = generation_job.DONE
+    job.heartbeat = timezone.now()
+    job.save(update_fields=['status', 'heartbeat'])
+    return job
+
+
+def fail(job, pending, error):
+    for future in pending:
+        future.cancel()
+    job.status = generation_job.FAILED
+    job.error = error
+    job.save(update_fields=['status', 'error'])
+
+
+def run_jobs(worker, workers, stale=300, once=False, poll=1.0):
+    """
+    Function that runs jobs until there are no jobs (once) or forever
+    ===
+    - worker - name of the worker
+    - workers - number of worker processes
+    - stale - seconds after which running job is taken by another worker
+    - once - exit when there are no jobs
+    - poll - seconds between checks of the queue
+    """
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            job = claim_job(worker, stale)
+            if job is not None:
+                try:
+                    run_job(job, pool, workers)
+                except BrokenProcessPool:
+                    # the broken pool does not accept tasks anymore, the next job gets a new one
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                continue
+            if once:
+                return
+            time.sleep(poll)
+    finally:
+        pool.shutdown()
@@ -0,0 +1,221 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+import hashlib
+import csv
+import json
+import os
+
+from backend.jobs.runner import chunk_seed
+from backend.models_genearateor.main import layer_models, GENERATION_PARAMS
+
+
+def load_spec(path):
+    """
+    Function that reads and checks the dataset spec file
+    ===
+    - path - JSON file: {"seed", "shards", "chunkSize", "output", "save": {"step", "skipLast"},
+      "groups": [{"count", "prefix", "params"}]} (count, prefix and params can be given at the top level for one group)
+    - ----
+    Every CSV row is the prefix of the group and the save_to_param row of one model
+    (thickness of every layer in every step column, then L and Ystart of every fault)
+    Returns spec with defaults
+    """
+    with open(path) as f:
+        spec = json.load(f)
+
+    if 'groups' not in spec:
+        spec['groups'] = [{'count': spec.pop('count'), 'prefix': spec.pop('prefix', ''), 'params': spec.pop('params')}]
+    spec.setdefault('seed', 0)
+    spec.setdefault('chunkSize', 1000)
+    spec.setdefault('shards', 1)
+    spec.setdefault('output', 'dataset.csv')
+    spec['save'] = {'step': 2, 'skipLast': False, **spec.get('save', {})}
+
+    if not isinstance(spec['seed'], int):
+        raise ValueError('seed must be an integer')
+    if not isinstance(spec['chunkSize'], int) or spec['chunkSize'] < 1:
+        raise ValueError('chunkSize must be a positive integer')
+    if not isinstance(spec['shards'], int) or spec['shards'] < 1:
+        raise ValueError('shards must be a positive integer')
+    for group in spec['groups']:
+        if not isinstance(group.get('count'), int) or group['count'] < 1:
+            raise ValueError('count of every group must be a positive integer')
+        if any(o in group['params'] for o in ('N', 'seed')):
+            raise ValueError('N and seed are set by the command, remove them from params')
+        unknown = [o for o in group['params'] if o not in GENERATION_PARAMS]
+        if unknown:
+            raise ValueError(f'params can contain only generation parameters, not {unknown}')
+        group.setdefault('prefix', '')
+    return spec
+
+
+def dataset_chunks(spec):
+    """
+    Function that splits all groups into chunks
+    ===
+    Returns list of (group index, count); chunk i is generated with chunk_seed(seed, i),
+    so models do not depend on the number of shards or on the machine that made them
+    """
+    chunks = []
+    for g, group in enumerate(spec['groups']):
+        chunks += [(g, min(spec['chunkSize'], group['count'] - start)) for start in range(0, group['count'], spec['chunkSize'])]
+    return chunks
+
+
+def shard_range(spec, shard):
+    """
+    Function that returns (first chunk, end chunk) of the shard, chunks are divided evenly
+    """
+    count = len(dataset_chunks(spec))
+    return shard * count // spec['shards'], (shard + 1) * count // spec['shards']
+
+
+def shard_paths(path, shard):
+    name = os.path.join(path, 'shards', f'shard-{shard:05d}')
+    return name + '.csv', name + '.json'
+
+
+def write_json(name, data):
+    # write + replace, so a crash leaves the previous file
+    with open(name + '.tmp', 'w') as f:
+        json.dump(data, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(name + '.tmp', name)
+
+
+def prepare(path, spec):
+    """
+    Function that creates the dataset directory or checks that it was made with the same spec
+    """
+    os.makedirs(os.path.join(path, 'shards'), exist_ok=True)
+    name = os.path.join(path, 'spec.json')
+    if os.path.exists(name):
+        with open(name) as f:
+            if json.load(f) != spec:
+                raise ValueError(f'{path} contains a dataset with another spec, use another directory')
+    else:
+        write_json(name, spec)
+
+
+def shard_state(path, shard):
+    """
+    Function that reads the checkpoint of the shard ({'chunks': done chunks, 'rows', 'bytes', 'done'})
+    """
+    name = shard_paths(path, shard)[1]
+    if not os.path.exists(name):
+        return {'chunks': 0, 'rows': 0, 'bytes': 0, 'done': False}
+    with open(name) as f:
+        return json.load(f)
+
+
+def run_shard(path, spec, shard):
+    """
+    Function that generates missing chunks of the shard, checkpoint is saved after every chunk
+    ===
+    - path - dataset directory
+    - spec - spec (see load_spec)
+    - shard - index of the shard
+    - ----
+    Rows written after the last checkpoint (interrupted chunk) are cut off and made again.
+    Returns (shard, rows, generated chunks)
+    """
+    csvPath, statePath = shard_paths(path, shard)
+    state = shard_state(path, shard)
+    if state['done']:
+        return shard, state['rows'], 0
+
+    first, end = shard_range(spec, shard)
+    chunks = dataset_chunks(spec)
+    with open(csvPath, 'ab') as f:
+        f.truncate(state['bytes'])
+
+    generated = 0
+    for index in range(first + state['chunks'], end):
+        g, count = chunks[index]
+        group = spec['groups'][g]
+        models = layer_models(N=count, seed=chunk_seed(spec['seed'], index), lazy=True, **group['params'])
+        rows = models.iter_params(skipLast=spec['save']['skipLast'], step=spec['save']['step'])
+        with open(csvPath, 'a', newline='') as f:
+            csv.writer(f).writerows([group['prefix'], *row] for row in rows)
+            f.flush()
+            os.fsync(f.fileno())
+
+        state['chunks'] += 1
+        state['rows'] += count
+        state['bytes'] = os.path.getsize(csvPath)
+        write_json(statePath, state)
+        generated += 1
+
+    state['done'] = True
+    write_json(statePath, state)
+    return shard, state['rows'], generated
+
+
+def run_shards(path, spec, shards, workers):
+    """
+    Function that runs shards in worker processes
+    ===
+    - path - dataset directory
+    - spec - spec (see load_spec)
+    - shards - indices of the shards
+    - workers - number of worker processes
+    - ----
+    Yields (shard, rows, generated chunks) when a shard is finished
+    """
+    prepare(path, spec)
+    if workers <= 1:
+        for shard in shards:
+            yield run_shard(path, spec, shard)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for future in as_completed([pool.submit(run_shard, path, spec, shard) for shard in shards]):
+            yield future.result()
+
+
+def merge_shards(path, spec):
+    """
+    Function that joins shard files into spec['output'] and writes manifest.json
+    ===
+    - path - dataset directory
+    - spec - spec (see load_spec)
+    - ----
+    Returns manifest; ValueError if some shards are not finished
+    """
+    prepare(path, spec)
+    states = [shard_state(path, o) for o in range(spec['shards'])]
+    missing = [o for o in range(spec['shards']) if not states[o]['done']]
+    if missing:
+        raise ValueError(f'shards are not finished: {missing}')
+
+    output = os.path.join(path, spec['output'])
+    digest = hashlib.sha256()
+    shards = []
+    with open(output + '.tmp', 'wb') as out:
+        for o, state in enumerate(states):
+            shardDigest = hashlib.sha256()
+            with open(shard_paths(path, o)[0], 'rb') as f:
+                # only the checkpointed part of the shard
+                left = state['bytes']
+                while left:
+                    block = f.read(min(left, 1 << 20))
+                    if not block:
+                        raise ValueError(f'shard {o} is shorter than its checkpoint')
+                    left -= len(block)
+                    out.write(block)
+                    digest.update(block)
+                    shardDigest.update(block)
+            first, end = shard_range(spec, o)
+            shards.append({'shard': o, 'chunks': [first, end], 'rows': state['rows'], 'bytes': state['bytes'],
+                           'sha256': shardDigest.hexdigest()})
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(output + '.tmp', output)
+
+    manifest = {'output': spec['output'], 'rows': sum(o['rows'] for o in shards), 'bytes': os.path.getsize(output),
+                'sha256': digest.hexdigest(), 'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'groups': [{'count': o['count'], 'prefix': o['prefix']} for o in spec['groups']],
+                'spec': spec, 'shards': shards}
+    write_json(os.path.join(path, 'manifest.json'), manifest)
+    return manifest
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+import random
+import json
+
+from backend.jobs.models import generation_job
+from backend.links import normalize, cors, result_response
+
+
+def job_or_404(id):
+    try:
+        return generation_job.objects.get(id=id), None
+    except generation_job.DoesNotExist:
+        return None, cors(JsonResponse({'error': 'job not found'}, status=404))
+
+
+@csrf_exempt
+def submit(request):
+    if request.method != "POST":
+        return cors(JsonResponse({'error': 'POST only'}, status=405))
+
+    try:
+        data = json.loads(request.body)
+        data.pop('stream', None)
+        data.pop('baseToken', None)
+        normalize(data)
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+        return cors(JsonResponse({'error': f'{type(e).__name__}: {e}'}, status=400))
+
+    N = data.pop('N', 1)
+    if not isinstance(N, int) or N < 1 or N > settings.JOB_MAX_MODELS:
+        return cors(JsonResponse({'error': f"N must be from 1 to {settings.JOB_MAX_MODELS}"}, status=400))
+
+    # Без seed задание получает свой seed, чтобы части можно было сгенерировать заново после перезапуска
+    seed = data.pop('seed', None)
+    if seed is None:
+        seed = random.getrandbits(63)
+
+    job = generation_job.objects.create(params=data, seed=seed, total=N, chunkSize=settings.JOB_CHUNK_SIZE)
+    return cors(JsonResponse(job.state(), status=202))
+
+
+def status(request, id):
+    job, response = job_or_404(id)
+    if job is None:
+        return response
+    return cors(JsonResponse(job.state()))
+
+
+def result(request, id):
+    # Результат отдаётся по частям: ?chunk=0..chunks-1
+    job, response = job_or_404(id)
+    if job is None:
+        return response
+
+    try:
+        index = int(request.GET.get('chunk', 0))
+    except ValueError:
+        return cors(JsonResponse({'error': 'chunk must be an integer'}, status=400))
+
+    chunk = job.chunks.filter(index=index).first()
+    if chunk is None:
+        status = 404 if index < 0 or index >= job.chunk_count() or job.status == generation_job.FAILED else 409
+        return cors(JsonResponse({'error': 'chunk is not ready', **job.state()}, status=status))
+
+    response = result_response(request, chunk.result())
+    response['X-Chunk'] = str(index)
+    response['X-Chunks'] = str(job.chunk_count())
+    return response
@@ -1,52 +1,325 @@
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from dotenv import load_dotenv
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+import asyncio
+import copy
+import uuid
 import os
 
-from backend.models_genearateor.main import layer_models
+from backend.cache import result_cache, cache_key
+from backend.encoding import JSON, negotiate, encode, compress
+from backend.timing import stage, histograms
+from backend.models_genearateor.main import layer_models, GENERATION_PARAMS
 
 import json
 
 load_dotenv()
 
-@csrf_exempt 
-def main(request):
-    result = []
-    if request.method == "POST":
-        data = json.loads(request.body)
-
-        # Перевод True/False в 1/0
-        for i in range(data['shiftCount']):
-            if (data['side'][i] == False): data['side'][i] = 0
-            else: data['side'][i] = 1
-            if (data['shiftType'][i] == False): data['shiftType'][i] = 0
-            else: data['shiftType'][i] = 1
-
-        # Удаление ненужных параметров в зависимости от способа генерации
-        match data['generationType']:
-            case 0:
-                del data['scatterAmount']
-            case 1:
-                del data['scatterMaxValue']
-                del data['scatterPeriod']
-                data['scatterAmount'].pop(0)
-                for i in range(len(data['scatterAmount'])):
-                    data['scatterAmount'][i] = -data['scatterAmount'][i]
-                data['smoothness'] = True
-        del data['generationType']
-
-        models = layer_models(**data)
-
-        result = models.save_to_param(skipLast=False, step=1)
+cache = result_cache(settings.RESULT_CACHE_SIZE)
+bases = result_cache(settings.BASE_CACHE_SIZE)
 
-    response_data = {}
-    response_data['result'] = result
+FAULT_PARAMS = ('Y', 'L', 'shiftForce', 'side', 'shiftType', 'shiftCount', 'withoutShift')
+
+executor = None
+queueLock = Lock()
+queued = 0
+
+
+def normalize(data):
+    # Перевод True/False в 1/0
+    for i in range(data['shiftCount']):
+        if (data['side'][i] == False): data['side'][i] = 0
+        else: data['side'][i] = 1
+        if (data['shiftType'][i] == False): data['shiftType'][i] = 0
+        else: data['shiftType'][i] = 1
+
+    # Удаление ненужных параметров в зависимости от способа генерации
+    match data['generationType']:
+        case 0:
+            del data['scatterAmount']
+        case 1:
+            del data['scatterMaxValue']
+            del data['scatterPeriod']
+            data['scatterAmount'].pop(0)
+            for i in range(len(data['scatterAmount'])):
+                data['scatterAmount'][i] = -data['scatterAmount'][i]
+            data['smoothness'] = True
+    del data['generationType']
+
+    # Из запроса берутся только параметры генерации, параметры движка (multiprocess, workers, lazy...) задаёт сервер
+    for o in [o for o in data if o not in GENERATION_PARAMS]:
+        del data[o]
+    return data
 
-    response = JsonResponse(response_data)
 
+def is_stream(request, data):
+    # Потоковый режим включается полем stream или заголовком Accept
+    return bool(data.pop('stream', False)) or 'application/x-ndjson' in request.headers.get('Accept', '')
+
+
+def cors(response):
     Host = os.environ['FRONT_IP']
 
     response["Access-Control-Allow-Origin"] = Host
     response["Access-Control-Allow-Methods"] = "POST"
     response["Access-Control-Allow-Headers"] = "Content-Type"
-    return response
\ No newline at end of file
+    # Без этого фронтенд с другого origin не видит baseToken в бинарных ответах и номера частей заданий
+    response["Access-Control-Expose-Headers"] = "X-Base-Token, X-Cache, X-Chunk, X-Chunks"
+    return response
+
+
+def stream_rows(models):
+    # Одна строка параметров на модель, модели генерируются по мере отправки
+    for row in models.iter_params(skipLast=False, step=1):
+        yield json.dumps(row) + '\n'
+
+
+def cached_response(request, data):
+    # Одинаковые запросы с seed дают одинаковый результат, поэтому их можно кэшировать
+    if data.get('seed') is None:
+        return None, None
+    contentType = negotiate(request)
+    key = cache_key(data, None if contentType == JSON else contentType)
+    content = cache.get(key)
+    if content is None:
+        return key, None
+    response = HttpResponse(content, content_type=contentType)
+    response['X-Cache'] = 'HIT'
+    return key, cors(compress(request, response))
+
+
+def result_response(request, result, key=None, baseToken=None):
+    response_data = {}
+    response_data['result'] = result
+    if baseToken:
+        response_data['baseToken'] = baseToken
+
+    # Формат ответа выбирается по Accept (JSON, float32, msgpack), сжатие - по Accept-Encoding
+    contentType = negotiate(request)
+    with stage('encode'):
+        response = HttpResponse(encode(response_data, contentType), content_type=contentType)
+    if baseToken:
+        response['X-Base-Token'] = baseToken
+
+    if key:
+        cache.set(key, response.content)
+        response['X-Cache'] = 'MISS'
+
+    with stage('compress'):
+        response = compress(request, response)
+    return cors(response)
+
+
+def generate(data):
+    models = layer_models(**data)
+    return models.save_to_param(skipLast=False, step=1)
+
+
+def session_response(request, token, data):
+    # Изменение разломов: базовые модели берутся из кэша по baseToken, заново считаются только разломы
+    baseKey = cache_key({o: data[o] for o in data if o not in FAULT_PARAMS})
+    item = bases.get(token) if token else None
+
+    if item is None or item[0] != baseKey:
+        # разломы берутся из reslice, как и при следующих запросах с этим token, иначе тот же seed дал бы другие разломы
+        models = layer_models(keepBase=True, **data).reslice()
+        token = uuid.uuid4().hex
+        bases.set(token, (baseKey, models), 2 * sum(o.nbytes for o in models.bases))
+    else:
+        # копия, чтобы параллельные запросы с одним token не мешали друг другу
+        models = copy.copy(item[1]).reslice(**{o: data[o] for o in FAULT_PARAMS if o in data})
+
+    return result_response(request, models.save_to_param(skipLast=False, step=1), baseToken=token)
+
+
+def shared(data):
+    # Сценарии без seed и без случайных толщин/значений можно генерировать одной моделью
+    count = data.get('layerCount', 3)
+    return (data.get('seed') is None and len(data.get('layerThickness', [])) >= count
+            and len(data.get('layerValues', [])) >= count)
+
+
+def bulk_groups(scenarios, errors):
+    # Проверка и нормализация всех сценариев, группировка совместимых
+    groups = {}
+    for i, scenario in enumerate(scenarios):
+        id = str(scenario.pop('id', i)) if isinstance(scenario, dict) else str(i)
+        try:
+            if not isinstance(scenario, dict):
+                raise TypeError('scenario must be an object')
+            scenario.pop('stream', None)
+            scenario.pop('baseToken', None)
+            data = normalize(scenario)
+            N = data.get('N', 1)
+            if not isinstance(N, int) or N < 1:
+                raise ValueError('N must be a positive integer')
+            if N > settings.GENERATION_MAX_MODELS:
+                raise ValueError(f"N is greater than {settings.GENERATION_MAX_MODELS}")
+        except Exception as e:
+            errors[id] = f'{type(e).__name__}: {e}'
+            continue
+
+        group = cache_key({o: data[o] for o in data if o != 'N'}) if shared(data) else id
+        groups.setdefault(group, []).append((id, data))
+    return groups
+
+
+def bulk_generate(items, results, errors):
+    # Группа генерируется одним вызовом, при ошибке сценарии считаются по одному
+    if len(items) > 1:
+        try:
+            data = dict(items[0][1], N=sum(o[1].get('N', 1) for o in items), batched=True)
+            rows = generate(data)
+            start = 0
+            for id, data in items:
+                results[id] = rows[start:start + data.get('N', 1)]
+                start += data.get('N', 1)
+            return
+        except Exception:
+            pass
+
+    for id, data in items:
+        try:
+            key = cache_key(data) if data.get('seed') is not None else None
+            content = cache.get(key) if key else None
+            if content is not None:
+                results[id] = json.loads(content)['result']
+                continue
+            results[id] = generate(data)
+            if key:
+                cache.set(key, JsonResponse({'result': results[id]}).content)
+        except Exception as e:
+            errors[id] = f'{type(e).__name__}: {e}'
+
+
+def get_executor():
+    global executor
+    with queueLock:
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=settings.GENERATION_WORKERS)
+        return executor
+
+
+def reset_executor(broken):
+    # Пул с упавшим процессом (OOM, segfault) больше не принимает задачи, следующий запрос создаст новый
+    global executor
+    with queueLock:
+        if executor is broken:
+            executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def reserve():
+    global queued
+    with queueLock:
+        if queued >= settings.GENERATION_QUEUE_DEPTH:
+            return False
+        queued += 1
+        return True
+
+
+def release():
+    global queued
+    with queueLock:
+        queued -= 1
+
+
+@csrf_exempt
+def main(request):
+    result = []
+    key = None
+    if request.method == "POST":
+        with stage('parse'):
+            data = json.loads(request.body)
+        stream = is_stream(request, data)
+        session = 'baseToken' in data
+        token = data.pop('baseToken', None)
+        normalize(data)
+
+        if stream:
+            models = layer_models(lazy=True, **data)
+            return cors(StreamingHttpResponse(stream_rows(models), content_type='application/x-ndjson'))
+
+        if session:
+            return session_response(request, token, data)
+
+        key, response = cached_response(request, data)
+        if response:
+            return response
+
+        result = generate(data)
+
+    return result_response(request, result, key)
+
+
+@csrf_exempt
+def main_bulk(request):
+    results = {}
+    errors = {}
+    if request.method == "POST":
+        with stage('parse'):
+            data = json.loads(request.body)
+        scenarios = data.get('scenarios', []) if isinstance(data, dict) else data
+        if not isinstance(scenarios, list):
+            return cors(JsonResponse({'error': 'scenarios must be a list'}, status=400))
+
+        for items in bulk_groups(scenarios, errors).values():
+            bulk_generate(items, results, errors)
+
+    return cors(compress(request, JsonResponse({'results': results, 'errors': errors})))
+
+
+def metrics(request):
+    # Метрики только для локальных запросов (или METRICS_PUBLIC)
+    if not settings.METRICS_PUBLIC and request.META.get('REMOTE_ADDR') not in ('127.0.0.1', '::1'):
+        return JsonResponse({'error': 'metrics are available only locally'}, status=403)
+
+    return JsonResponse({**histograms.snapshot(), 'resultCache': cache.stats(), 'baseCache': bases.stats(), 'queued': queued})
+
+
+async def main_async(request):
+    result = []
+    key = None
+    if request.method == "POST":
+        with stage('parse'):
+            data = json.loads(request.body)
+        data.pop('stream', None)
+        data.pop('baseToken', None)
+        normalize(data)
+
+        # Слишком большие запросы сразу отклоняются, их нужно разбить или отправить в обычный endpoint
+        if data.get('N', 1) > settings.GENERATION_MAX_MODELS:
+            return cors(JsonResponse({'error': f"N is greater than {settings.GENERATION_MAX_MODELS}"}, status=413))
+
+        key, response = cached_response(request, data)
+        if response:
+            return response
+
+        # Очередь переполнена - отвечаем сразу, а не копим запросы
+        if not reserve():
+            response = JsonResponse({'error': 'generation queue is full'}, status=503)
+            response['Retry-After'] = '1'
+            return cors(response)
+
+        pool = get_executor()
+        try:
+            # Этапы внутри процесса-исполнителя не видны, измеряется вся генерация
+            with stage('generate_pool'):
+                result = await asyncio.get_running_loop().run_in_executor(pool, generate, data)
+        except BrokenProcessPool:
+            reset_executor(pool)
+            response = JsonResponse({'error': 'generation worker stopped, try again'}, status=503)
+            response['Retry-After'] = '1'
+            return cors(response)
+        finally:
+            release()
+
+    return result_response(request, result, key)
+
+
+# csrf_exempt в Django 4.2 не поддерживает async view
+main_async.csrf_exempt = True
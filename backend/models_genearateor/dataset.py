@@ -0,0 +1,132 @@
+import numpy as np
+import json
+import os
+
+
+class dataset_writer:
+    def __init__(self, path, columns, modelShape=None, dtype='float32', capacity=1024):
+        """
+        Writer of parameter rows (and raw models) into memory-mapped .npy files
+        ===
+        - path - dataset directory (existing dataset is continued)
+        - columns - names of the row columns (list)
+        - modelShape - (NY, NX) of raw models (None = do not save models)
+        - dtype - type of the saved values
+        - capacity - number of rows that are allocated at once
+        - ----
+        Files: header.json, params.npy (capacity x columns), models.npy (capacity x NY x NX)
+        """
+        self.path = path
+        self.headerPath = os.path.join(path, 'header.json')
+        self.paramsPath = os.path.join(path, 'params.npy')
+        self.modelsPath = os.path.join(path, 'models.npy')
+
+        if os.path.exists(self.headerPath):
+            with open(self.headerPath) as f:
+                self.header = json.load(f)
+            if self.header['columns'] != list(columns):
+                raise ValueError('columns do not match existing dataset')
+            if (self.header['modelShape'] is None) != (modelShape is None) or (modelShape and list(modelShape) != self.header['modelShape']):
+                raise ValueError('modelShape does not match existing dataset')
+            self.params = np.load(self.paramsPath, mmap_mode='r+')
+            self.models = np.load(self.modelsPath, mmap_mode='r+') if modelShape else None
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.header = {'columns': list(columns), 'dtype': np.dtype(dtype).name, 'rows': 0,
+                           'capacity': 0, 'modelShape': list(modelShape) if modelShape else None}
+            self.params = None
+            self.models = None
+            self.__grow(capacity)
+
+        self.rows = self.header['rows']
+
+
+    def __grow(self, capacity):
+        # new file is filled and then replaces the old one, so a crash keeps the previous dataset
+        dtype = np.dtype(self.header['dtype'])
+        params = np.lib.format.open_memmap(self.paramsPath + '.tmp', mode='w+', dtype=dtype, shape=(capacity, len(self.header['columns'])))
+        if self.params is not None:
+            params[:self.header['rows']] = self.params[:self.header['rows']]
+        params.flush()
+
+        models = None
+        if self.header['modelShape']:
+            models = np.lib.format.open_memmap(self.modelsPath + '.tmp', mode='w+', dtype=dtype, shape=(capacity, *self.header['modelShape']))
+            if self.models is not None:
+                models[:self.header['rows']] = self.models[:self.header['rows']]
+            models.flush()
+
+        self.params = None
+        self.models = None
+        os.replace(self.paramsPath + '.tmp', self.paramsPath)
+        self.params = params
+        if models is not None:
+            os.replace(self.modelsPath + '.tmp', self.modelsPath)
+            self.models = models
+
+        self.header['capacity'] = capacity
+        self.__write_header()
+
+
+    def __write_header(self):
+        with open(self.headerPath + '.tmp', 'w') as f:
+            json.dump(self.header, f)
+        os.replace(self.headerPath + '.tmp', self.headerPath)
+
+
+    def write(self, rows, models=None):
+        """
+        Function that appends rows (and models)
+        ===
+        - rows - parameter rows (list or 2d array)
+        - models - raw models of the rows (list or 3d array)
+        """
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.ndim != 2 or rows.shape[1] != len(self.header['columns']):
+            raise ValueError(f"rows must have {len(self.header['columns'])} columns")
+        if (models is None) != (self.models is None):
+            raise ValueError('models must be passed only if dataset has modelShape')
+
+        if self.rows + len(rows) > self.header['capacity']:
+            self.__grow(max(self.header['capacity'] * 2, self.rows + len(rows)))
+
+        self.params[self.rows:self.rows + len(rows)] = rows
+        if models is not None:
+            self.models[self.rows:self.rows + len(rows)] = models
+        self.rows += len(rows)
+
+
+    def flush(self):
+        """
+        Function that saves written rows to the disk (dataset is resumed from the last flush)
+        """
+        self.params.flush()
+        if self.models is not None:
+            self.models.flush()
+        self.header['rows'] = self.rows
+        self.__write_header()
+
+
+    def close(self):
+        self.flush()
+        self.params = None
+        self.models = None
+
+
+def load_dataset(path, mmap=True):
+    """
+    Function that loads dataset without copying
+    ===
+    - path - dataset directory
+    - mmap - memory-map files instead of reading them
+    - ----
+    Returns (header, params, models) where models is None if they were not saved
+    """
+    with open(os.path.join(path, 'header.json')) as f:
+        header = json.load(f)
+    mode = 'r' if mmap else None
+    params = np.load(os.path.join(path, 'params.npy'), mmap_mode=mode)[:header['rows']]
+    models = None
+    if header['modelShape']:
+        models = np.load(os.path.join(path, 'models.npy'), mmap_mode=mode)[:header['rows']]
+    return header, params, models
@@ -0,0 +1,497 @@
+import numpy as np
+
+
+def bezier_basis(NX, pointsCount, columns=None):
+    """
+    Function that precomputes bezier basis for every column
+    ===
+    - NX - number of columns
+    - pointsCount - number of control points of the curve
+    - columns - indices of generated columns (default = all)
+    - ----
+    Returns list of (basis vector, coefficient) in the same order as layer_models.bezier_curves
+    """
+    degree = pointsCount - 1
+    t = [int(j)/NX for j in (range(NX) if columns is None else columns)]
+    basis = []
+    for num in range(pointsCount):
+        coefficient = 1 if num%degree == 0 else degree
+        vector = np.array([((1-temp)**(num)) * (temp ** (degree - num)) for temp in t], dtype=np.float64)
+        basis.append((vector, coefficient))
+    return basis
+
+
+def bezier_curve(basis, arr):
+    """
+    Function that evaluates bezier curve in every column
+    ===
+    - basis - result of bezier_basis
+    - arr - control points
+    """
+    y = np.zeros(len(basis[0][0]))
+    for num, (vector, coefficient) in enumerate(basis):
+        y += vector * arr[len(arr) - 1 - num] * coefficient
+    return y
+
+
+def smooth_model(NY, NX, layerThickness, layerValues, scatterAmount, columns=None):
+    """
+    Function that generates smooth layer model with bezier interfaces
+    ===
+    - NY - number of rows
+    - NX - number of columns
+    - layerThickness - size of every layer (list)
+    - layerValues - value in every layer (list)
+    - scatterAmount - height of scatter
+    - columns - indices of generated columns (default = all)
+    """
+    basis = bezier_basis(NX, len(scatterAmount) + 1, columns)
+    model = np.full(shape=(NY, len(basis[0][0])), fill_value=layerValues[0], dtype=np.float64)
+    rows = np.arange(NY)[:, None]
+
+    temp = 0
+    for o in range(len(layerThickness) - 1):
+        temp += layerThickness[o]
+        arrY = [temp]
+        for i in range(len(scatterAmount)):
+            arrY.append(temp + scatterAmount[i])
+
+        y = bezier_curve(basis, arrY)
+        model[rows > y] = layerValues[o + 1]
+    return model
+
+
+def smooth_interfaces(NY, NX, layerThickness, layerCount, scatterAmount, columns=None):
+    """
+    Function that generates first row of every interface of smooth layer model
+    ===
+    - NY - number of rows
+    - NX - number of columns
+    - layerThickness - size of every layer (list)
+    - layerCount - number of layer values
+    - scatterAmount - height of scatter
+    - columns - indices of generated columns (default = all)
+    """
+    basis = bezier_basis(NX, len(scatterAmount) + 1, columns)
+    interfaces = np.full(shape=(layerCount - 1, len(basis[0][0])), fill_value=NY, dtype=np.intp)
+
+    temp = 0
+    for o in range(min(len(layerThickness), layerCount) - 1):
+        temp += layerThickness[o]
+        arrY = [temp]
+        for i in range(len(scatterAmount)):
+            arrY.append(temp + scatterAmount[i])
+
+        # first row that is strictly below the curve
+        y = bezier_curve(basis, arrY)
+        interfaces[o] = np.clip(np.floor(np.clip(y, -1, NY)) + 1, 0, NY)
+
+    # deeper layers overwrite upper ones, so interface k starts at the first row of any layer >= k
+    return np.minimum.accumulate(interfaces[::-1], axis=0)[::-1]
+
+
+def fault_shift(model, temp, Ystart, L, side, shiftType, shiftForce, upperValue, downValue, columns=None):
+    """
+    Function that shifts model along the geological fault (in place)
+    ===
+    - model - layer model
+    - temp - slope of the fault line (tan(90 - L))
+    - Ystart - column where fault line starts
+    - L - angle of geological fault
+    - side - fault side (0 = left ; 1 - right)
+    - shiftType - recession or shift (0 = down ; 1 = up)
+    - shiftForce - force of the geological fault (>= 0)
+    - upperValue - value that fills the top after recession
+    - downValue - value that fills the bottom after shift
+    - columns - indices of model columns (default = all)
+    """
+    rows = model.shape[0]
+    mask = fault_mask(rows, model.shape[1], temp, Ystart, L, side, columns)
+
+    # every cell reads the unshifted part of its column, so one gather is enough
+    if (shiftType):
+        source = np.arange(rows) + shiftForce
+        shifted = np.take(model, np.minimum(source, rows - 1), axis=0)
+        shifted[source >= rows] = downValue
+    else:
+        source = np.arange(rows) - shiftForce
+        shifted = np.take(model, np.maximum(source, 0), axis=0)
+        shifted[source < 0] = upperValue
+
+    np.copyto(model, shifted, where=mask)
+    return model
+
+
+def fault_shift_batch(models, temp, Ystart, L, side, shiftType, shiftForce, upperValue, downValue, columns=None):
+    """
+    Function that shifts every model of the stack along its own geological fault (in place)
+    ===
+    - models - stack of layer models (count x rows x columns)
+    - temp, Ystart, L, shiftForce - arrays with the value of every model (see fault_shift)
+    - side, shiftType, upperValue, downValue, columns - same as in fault_shift
+    """
+    count, rows, width = models.shape
+    rowIndex = np.arange(rows)[:, None]
+    L = np.asarray(L)
+    de2 = (np.asarray(temp)[:, None] * (column_index(width, columns) - np.asarray(Ystart)[:, None]))[:, None, :]
+    above = (L >= 0) if side else (L <= 0)
+    mask = np.where(above[:, None, None], de2 >= rowIndex, de2 <= rowIndex)
+
+    source = np.arange(rows) + (1 if shiftType else -1) * np.asarray(shiftForce)[:, None]
+    shifted = models[np.arange(count)[:, None], np.clip(source, 0, rows - 1)]
+    if (shiftType):
+        shifted[source >= rows] = downValue
+    else:
+        shifted[source < 0] = upperValue
+
+    np.copyto(models, shifted, where=mask)
+    return models
+
+
+def fault_mask(rows, width, temp, Ystart, L, side, columns=None):
+    """
+    Function that finds cells which are moved by the geological fault
+    ===
+    - rows - number of rows
+    - width - number of model columns
+    - temp, Ystart, L, side, columns - same as in fault_shift
+    """
+    rowIndex = np.arange(rows)[:, None]
+    de2 = temp * (column_index(width, columns) - Ystart)
+
+    if ((side and L >= 0) or (not side and L <= 0)):
+        return de2 >= rowIndex
+    return de2 <= rowIndex
+
+
+def fault_source(source, temp, Ystart, L, side, shiftType, shiftForce, columns=None):
+    """
+    Function that adds geological fault to the map of source rows (in place)
+    ===
+    - source - row of the base model that every cell reads (rows x columns),
+      rows is upperValue and rows + 1 is downValue
+    - temp, Ystart, L, side, shiftType, shiftForce, columns - same as in fault_shift
+    - ----
+    Faults are composed in the same order as sequential fault_shift calls
+    """
+    rows = source.shape[0]
+    mask = fault_mask(rows, source.shape[1], temp, Ystart, L, side, columns)
+
+    if (shiftType):
+        index = np.arange(rows) + shiftForce
+        shifted = np.take(source, np.minimum(index, rows - 1), axis=0)
+        shifted[index >= rows] = rows + 1
+    else:
+        index = np.arange(rows) - shiftForce
+        shifted = np.take(source, np.maximum(index, 0), axis=0)
+        shifted[index < 0] = rows
+
+    np.copyto(source, shifted, where=mask)
+    return source
+
+
+def apply_source(model, source, upperValue, downValue):
+    """
+    Function that makes faulted model from base model and map of source rows (see fault_source)
+    ===
+    - model - base layer model
+    - source - row of the base model that every cell reads
+    - upperValue - value that fills the top after recession
+    - downValue - value that fills the bottom after shift
+    """
+    rows = model.shape[0]
+    extended = np.empty(shape=(rows + 2, model.shape[1]), dtype=model.dtype)
+    extended[:rows] = model
+    extended[rows] = upperValue
+    extended[rows + 1] = downValue
+    return extended[source, np.arange(model.shape[1])]
+
+
+def fault_shift_interfaces(interfaces, NY, temp, Ystart, L, side, shiftType, shiftForce, columns=None):
+    """
+    Function that shifts first row of every interface along the geological fault
+    ===
+    - interfaces - first row of every interface in every column (layers - 1 x columns)
+    - NY - number of rows
+    - temp, Ystart, L, side, shiftType, shiftForce, columns - same as in fault_shift
+    - ----
+    Columns are treated as monotone (interface k is the first row that reaches layer k),
+    so the result is exact only for the first fault (layer_models uses it only when shiftCount <= 1)
+    """
+    de2 = temp * (column_index(interfaces.shape[1], columns) - Ystart)
+
+    # rows [low, high] read the column shifted by shiftForce, rows [otherLow, otherHigh] are kept
+    if ((side and L >= 0) or (not side and L <= 0)):
+        low, high = 0, np.floor(np.clip(de2, -1, NY - 1)).astype(np.intp)
+        otherLow, otherHigh = high + 1, NY - 1
+    else:
+        low, high = np.ceil(np.clip(de2, 0, NY)).astype(np.intp), NY - 1
+        otherLow, otherHigh = 0, low - 1
+
+    # bottom is filled with the last layer after shift, top with the first one after recession
+    shifted = np.maximum(interfaces - (shiftForce if shiftType else -shiftForce), low)
+    kept = np.maximum(interfaces, otherLow)
+    return np.minimum(np.where(shifted <= high, shifted, NY), np.where(kept <= otherHigh, kept, NY))
+
+
+def column_index(width, columns=None):
+    """
+    Function that returns index of every generated column in the full model
+    ===
+    - width - number of generated columns
+    - columns - indices of generated columns (default = all)
+    """
+    return np.arange(width) if columns is None else np.asarray(columns)
+
+
+def layer_indices(model, layerValues):
+    """
+    Function that maps model values to layer indices (like list.index)
+    ===
+    - model - layer model
+    - layerValues - value in every layer (list)
+    """
+    indices = np.full(np.shape(model), -1, dtype=np.int16)
+    for k in reversed(range(len(layerValues))):
+        indices[model == layerValues[k]] = k
+    if (indices < 0).any():
+        raise ValueError('model contains values that are not in layerValues')
+    return indices
+
+
+def interface_rows(indices, count, sequential=False):
+    """
+    Function that finds the first row of every interface in every column
+    ===
+    - indices - layer indices of the model (rows x columns)
+    - count - number of interfaces
+    - sequential - interface k is searched only below interface k-1 (legacy save)
+    - ----
+    Columns where the interface is not found get number of rows
+    """
+    rows, columns = indices.shape
+    rowIndex = np.arange(rows)[:, None]
+    result = np.empty(shape=(count, columns), dtype=np.intp)
+    previous = np.full(shape=columns, fill_value=-1)
+    for k in range(1, count + 1):
+        reached = indices >= k
+        if sequential:
+            reached &= rowIndex > previous
+        result[k - 1] = np.where(reached.any(axis=0), reached.argmax(axis=0), rows)
+        previous = result[k - 1]
+    return result
+
+
+def depth_table(rows, metricPerCell, roundPoint=None):
+    """
+    Function that precomputes depth of every row border
+    ===
+    - rows - number of rows
+    - metricPerCell - size of one cell
+    - roundPoint - number of decimals (no rounding if None)
+    """
+    counter = 0
+    table = []
+    for j in range(rows + 1):
+        table.append(counter if roundPoint is None else round(counter, roundPoint))
+        counter += metricPerCell
+    # keep python numbers so that int/float results are the same as in the per-cell loop
+    return np.array(table, dtype=object)
+
+
+def model_thickness(indices, count, table, skipLast=False, step=1, sequential=False):
+    """
+    Function that extracts interface depths of every sampled column
+    ===
+    - indices - layer indices of the model (rows x columns)
+    - count - number of interfaces
+    - table - result of depth_table
+    - skipLast - do not add depth of the model bottom
+    - step - column step
+    - sequential - interface k is searched only below interface k-1 (legacy save)
+    - ----
+    Returns array (interfaces x columns)
+    """
+    indices = indices[:, ::step]
+    return interfaces_thickness(interface_rows(indices, count, sequential), table, skipLast)
+
+
+def interfaces_thickness(interfaces, table, skipLast=False, step=1):
+    """
+    Function that converts first rows of interfaces to depths
+    ===
+    - interfaces - first row of every interface in every column
+    - table - result of depth_table
+    - skipLast - do not add depth of the model bottom
+    - step - column step
+    - ----
+    Returns array (interfaces x columns)
+    """
+    interfaces = interfaces[:, ::step]
+    if (not skipLast):
+        interfaces = np.vstack([interfaces, np.full(shape=(1, interfaces.shape[1]), fill_value=len(table) - 1)])
+    return np.array(table[interfaces].tolist())
+
+
+def interfaces_model(interfaces, NY, layerValues):
+    """
+    Function that rasterizes first rows of interfaces to layer model
+    ===
+    - interfaces - first row of every interface in every column
+    - NY - number of rows
+    - layerValues - value in every layer (list)
+    """
+    rowIndex = np.arange(NY)[:, None]
+    layers = np.zeros(shape=(NY, interfaces.shape[1]), dtype=np.intp)
+    for interface in interfaces:
+        layers += rowIndex >= interface
+    return np.asarray(layerValues, dtype=np.float64)[layers]
+
+
+def row_layers(NY, layerThickness, layerCount):
+    """
+    Function that finds layer of every row (same counter as in generate_base)
+    ===
+    - NY - number of rows
+    - layerThickness - size of every layer (list)
+    - layerCount - number of layer values
+    """
+    boundaries = np.cumsum(layerThickness)
+    return np.minimum(np.searchsorted(boundaries, np.arange(1, NY + 1), side='right'), layerCount - 1)
+
+
+def scatter_layers(NY, NX, layerThickness, layerCount, scatterMaxValue, scatterPeriod, rng, count=None):
+    """
+    Function that generates layer indices of every scatter block (rows x blocks)
+    ===
+    - NY - number of rows
+    - NX - number of columns
+    - layerThickness - size of every layer (list)
+    - layerCount - number of layer values
+    - scatterMaxValue - maximum scatter value of every layer
+    - scatterPeriod - scatter period
+    - rng - numpy random generator
+    - count - number of models (result is count x rows x blocks, default = one model)
+    """
+    layers = row_layers(NY, layerThickness, layerCount)
+    blocks = -(-NX // scatterPeriod)
+    size = (NY, blocks) if count is None else (count, NY, blocks)
+
+    # row i of block b overwrites rows i-scatter+1..i, the last (lowest) row that reaches a cell wins
+    scatterMax = np.full(shape=layerCount, fill_value=scatterMaxValue)[layers]
+    scatter = np.maximum(rng.integers(0, scatterMax[:, None] + 1, size=size), 1)
+    reach = np.zeros(shape=size, dtype=np.intp)
+    for u in range(1, min(int(scatter.max()), NY)):
+        reach[..., :NY - u, :][scatter[..., u:, :] > u] = u
+
+    return layers[np.arange(NY)[:, None] + reach]
+
+
+def scatter_model(NY, NX, layerThickness, layerValues, scatterMaxValue, scatterPeriod, rng, columns=None, count=None):
+    """
+    Function that generates layer model with scatter
+    ===
+    - NY - number of rows
+    - NX - number of columns
+    - layerThickness - size of every layer (list)
+    - layerValues - value in every layer (list)
+    - scatterMaxValue - maximum scatter value of every layer
+    - scatterPeriod - scatter period
+    - rng - numpy random generator
+    - columns - indices of generated columns (default = all)
+    - count - number of models (default = one model)
+    """
+    # blocks are drawn for the full width, so sparse columns match the full model
+    blockLayers = scatter_layers(NY, NX, layerThickness, len(layerValues), scatterMaxValue, scatterPeriod, rng, count)
+    return np.asarray(layerValues, dtype=np.float64)[blockLayers[..., column_index(NX, columns) // scatterPeriod]]
+
+
+def scatter_interfaces(NY, NX, layerThickness, layerCount, scatterMaxValue, scatterPeriod, rng, columns=None):
+    """
+    Function that generates first row of every interface of layer model with scatter
+    ===
+    - parameters are the same as in scatter_model
+    """
+    blockLayers = scatter_layers(NY, NX, layerThickness, layerCount, scatterMaxValue, scatterPeriod, rng)
+    return interface_rows(blockLayers, layerCount - 1)[:, column_index(NX, columns) // scatterPeriod]
+
+
+def sole_boundaries(sole, NX, rng, count=None):
+    """
+    Function that generates depth of every sole boundary in every column
+    ===
+    - sole - outsole layer (1d list of depths or 2d list of [min, max] depths)
+    - NX - number of columns
+    - rng - numpy random generator
+    - count - number of models (result is count x boundaries x columns, default = one model)
+    - ----
+    2d sole is a random walk (steps -9..9) reflected into [min, max]
+    """
+    shape = (len(sole), NX) if count is None else (count, len(sole), NX)
+    if (type(sole[0]) is not list):
+        return np.broadcast_to(np.asarray(sole)[:, None], shape).copy()
+
+    bounds = np.asarray(sole)
+    low = bounds[:, :1]
+    width = bounds[:, 1:] - low
+    start = rng.integers(low, bounds[:, 1:] + 1, size=shape[:-1] + (1,))
+    walk = start + np.cumsum(rng.integers(-9, 10, size=shape), axis=-1)
+    offset = np.mod(walk - low, np.maximum(2*width, 1))
+    return low + np.where(offset > width, 2*width - offset, offset)
+
+
+def sole_layer_boundaries(sole, NX, rng, columns=None, count=None):
+    """
+    Function that generates sole boundaries where layer actually changes
+    ===
+    - sole - outsole layer (2d or 1d array)
+    - NX - number of columns
+    - rng - numpy random generator
+    - columns - indices of generated columns (default = all)
+    - count - number of models (default = one model)
+    """
+    # random walk depends on every previous column, so it is always made for the full width
+    boundaries = sole_boundaries(sole, NX, rng, count)[..., column_index(NX, columns)]
+
+    # layer changes at most once per row, as in the counter loop
+    k = np.arange(len(sole))[:, None]
+    return k + np.maximum.accumulate(boundaries - k, axis=-2)
+
+
+def sole_model(NY, NX, sole, layerValues, rng, columns=None, count=None):
+    """
+    Function that generates layer model with sole
+    ===
+    - NY - number of rows
+    - NX - number of columns
+    - sole - outsole layer (2d or 1d array)
+    - layerValues - value in every layer (list)
+    - rng - numpy random generator
+    - columns - indices of generated columns (default = all)
+    - count - number of models (default = one model)
+    """
+    boundaries = sole_layer_boundaries(sole, NX, rng, columns, count)
+
+    rowIndex = np.arange(NY)[:, None]
+    layers = np.zeros(shape=boundaries.shape[:-2] + (NY, boundaries.shape[-1]), dtype=np.intp)
+    for k in range(len(sole)):
+        layers += rowIndex >= boundaries[..., k, None, :]
+    return np.asarray(layerValues, dtype=np.float64)[np.minimum(layers, len(layerValues) - 1)]
+
+
+def sole_interfaces(NY, NX, sole, layerCount, rng, columns=None):
+    """
+    Function that generates first row of every interface of layer model with sole
+    ===
+    - NY - number of rows
+    - NX - number of columns
+    - sole - outsole layer (2d or 1d array)
+    - layerCount - number of layer values
+    - rng - numpy random generator
+    - columns - indices of generated columns (default = all)
+    """
+    boundaries = sole_layer_boundaries(sole, NX, rng, columns)
+    interfaces = np.full(shape=(layerCount - 1, boundaries.shape[1]), fill_value=NY, dtype=np.intp)
+    count = min(len(boundaries), layerCount - 1)
+    interfaces[:count] = np.clip(boundaries[:count], 0, NY)
+    return interfaces
@@ -1,15 +1,28 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import random
 import math 
 import csv
 from decimal import Decimal
 
+from backend.models_genearateor.engine import smooth_model, scatter_model, sole_model, fault_shift, layer_indices, depth_table, model_thickness
+from backend.models_genearateor.engine import smooth_interfaces, scatter_interfaces, sole_interfaces, fault_shift_interfaces, interfaces_thickness, interfaces_model
+from backend.models_genearateor.engine import fault_source, apply_source, fault_shift_batch
+from backend.models_genearateor.dataset import dataset_writer
+from backend import timing
+
+
+# parameters of the generated models, the other layer_models parameters (multiprocess, workers, lazy,
+# compact, boundary, batched, keepBase...) choose how models are made and are set by the server
+GENERATION_PARAMS = ('N', 'NY', 'NX', 'layerCount', 'layerThickness', 'layerValues', 'scatterMaxValue', 'scatterPeriod',
+                     'smoothness', 'scatterAmount', 'sole', 'Y', 'L', 'shiftForce', 'side', 'shiftType', 'shiftCount',
+                     'withoutShift', 'metricPerCell', 'seed')
 
 class layer_models:
     def __init__(self, N = 1, NY=60, NX=120, layerCount = 3, layerThickness=[], layerValues=[],
                   scatterMaxValue=5, scatterPeriod=5, smoothness=False, Y=None, L=None, shiftForce=None,
-                  side = None, shiftType = None, shiftCount = 1, multiprocess=False, scatterAmount = [], sole=None, withoutShift=False, metricPerCell=1):
+                  side = None, shiftType = None, shiftCount = 1, multiprocess=False, scatterAmount = [], sole=None, withoutShift=False, metricPerCell=1,
+                  vectorized=True, workers=None, compact=False, lazy=False, seed=None, boundary=False, columnStep=1, composeFaults=False,
+                  batched=False, keepBase=False):
         """
         Function that generate N models
         ===
@@ -34,7 +47,22 @@ class layer_models:
         - shiftCount - shift count
         - ----
         - multiprocess - enables multiprocess
+        - workers - number of worker processes (default = number of cores)
+        - vectorized - use numpy engine instead of per-cell loops (same result)
+        - compact - keep all models in one (N, NY, NX) array of layer indices (models is a float view)
+        - lazy - do not generate models in advance (use iter_models / iter_params)
+        - seed - seed of the model random generators (same seed = same models)
+        - boundary - keep only first row of every interface in every column (models are rasterized on demand).
+          Works only for one fault with shiftForce >= 0: after a fault a column may be non-monotone,
+          so with more faults raster models are generated instead (boundary is ignored)
+        - columnStep - generate only every columnStep column (save step must be a multiple of it, numpy engine only)
+        - composeFaults - compose all faults into one map of source rows and apply it once (same result)
+        - batched - generate many models at once as one (models x NY x NX) array (other random stream)
+        - keepBase - keep models before faults so that faults can be changed with reslice (sequential generation)
         """
+        if columnStep > 1 and not vectorized:
+            raise ValueError('columnStep works only with vectorized engine')
+
         self.N = N
         self.NY = NY
         self.NX = NX
@@ -46,6 +74,22 @@ class layer_models:
         self.sole = sole
         self.smoothness = smoothness
         self.multiprocess = multiprocess
+        self.vectorized = vectorized
+        self.workers = workers
+        self.compact = compact
+        self.lazy = lazy
+        self.seed = seed
+        self.boundary = boundary and (withoutShift or shiftCount == 0 or (shiftCount == 1 and shiftForce[0][0] >= 0))
+        self.faultSave = None
+        self.columnStep = columnStep
+        self.composeFaults = composeFaults
+        self.batched = batched
+        self.keepBase = keepBase
+        self.bases = []
+        self.columns = np.arange(0, NX, columnStep) if columnStep > 1 else None
+        self.width = len(range(0, NX, columnStep))
+        self.random = random.Random(seed)
+        self.npRandom = np.random.default_rng(seed)
 
         self.Y = Y
         self.L = L
@@ -60,10 +104,11 @@ class layer_models:
         self.LSave = []
         self.YstartSave = []
         self.layerValuesSave = []
-        self.models = self.__gen_models()
         self.metricPerCell = metricPerCell
+        self.models = [] if lazy else self.__gen_models()
 
 
+    @timing.timed('generate_base')
     def generate_base(self):
         """
         Function that generates layer model
@@ -78,46 +123,16 @@ class layer_models:
         - smoothness - smooth scatter
         - scatterAmount - height of scatter (only in smooth mode)
         """ 
-        if (len(self.layerThickness) < self.layerCount):
-            val = round(np.random.uniform(self.NY/9, self.NY/6))
-            self.layerThickness = [val]
-            tempsum = val
-            for i in range(self.layerCount - 1):
-                temp2 = self.NY - self.layerThickness[0]
-                temp = round(np.random.uniform(temp2/10, abs((temp2/2.5) * (temp2 - tempsum)/temp2) + temp2/10))
-                self.layerThickness.append(temp)
-                tempsum +=temp
-                if (tempsum > self.NY - self.NY/5):
-                    break
-            while True:
-                if (self.layerCount != len(self.layerThickness)):
-                    index = np.argmax(self.layerThickness)
-                    val = round(self.layerThickness[index]/2)
-                    self.layerThickness[index] = val
-                    self.layerThickness.append(val)
-                else: break
-
-        if (len(self.layerValues) < self.layerCount):
-            self.layerValues = []
-            temp = 1
-            for i in range(self.layerCount):
-                temp += random.randint(10, 30)
-                self.layerValues.append(temp)
+        self.__prepare_base()
 
         currentLayer = 0
         scatter = 0
 
-        self.upperValue = self.layerValues[0]
-        self.downValue = self.layerValues[len(self.layerValues)-1]
-        self.layerValuesSave.append(self.layerValues)
-
         model = np.empty(shape=(self.NY,self.NX))
 
         if (self.smoothness):
-            if not self.scatterAmount:
-                self.scatterAmount = []
-                for i in range(random.randint(2,3)):
-                    self.scatterAmount.append(random.randint(int(self.NY/10), int(self.NY/5)) * (1 if random.random() < 0.5 else -1))
+            if self.vectorized:
+                return smooth_model(self.NY, self.NX, self.layerThickness, self.layerValues, self.scatterAmount, self.columns)
             model.fill(self.layerValues[0])
             temp = 0
             for o in range(len(self.layerThickness) - 1):
@@ -134,10 +149,12 @@ class layer_models:
                         if (i > y):
                             model[i][j] = self.layerValues[o + 1]
         else:
-            if self.sole:
+            if self.sole and self.vectorized:
+                return sole_model(self.NY, self.NX, self.sole, self.layerValues, self.npRandom, self.columns)
+            elif self.sole:
                 prevSole = []
                 for o in self.sole:
-                    prevSole.append(random.randint(o[0], o[1]))
+                    prevSole.append(self.random.randint(o[0], o[1]))
 
                 for i in range(self.NX):
                     if (type(self.sole[0]) is not list):
@@ -145,7 +162,7 @@ class layer_models:
                     else:
                         tempSole = []
                         for o in range(len(self.sole)):
-                            tempSole.append(random.randint(np.clip(prevSole[o] - 9, self.sole[o][0], self.sole[o][1]), 
+                            tempSole.append(self.random.randint(np.clip(prevSole[o] - 9, self.sole[o][0], self.sole[o][1]), 
                                                            np.clip(prevSole[o] + 9, self.sole[o][0], self.sole[o][1])))
 
                     counter = 0
@@ -159,15 +176,15 @@ class layer_models:
                     prevSole = tempSole
             else:
                 tempThickness = self.layerThickness[:]
-                if (self.scatterMaxValue is not list):
-                    self.scatterMaxValue = np.full(shape=self.layerCount,  fill_value = self.scatterMaxValue)
+                if self.vectorized:
+                    return scatter_model(self.NY, self.NX, self.layerThickness, self.layerValues, self.scatterMaxValue, self.scatterPeriod, self.npRandom, self.columns)
                 for i in range(self.NY):
                     tempThickness[currentLayer] -= 1
                     if (tempThickness[currentLayer] == 0 and len(self.layerValues) - 1 > currentLayer):
                         currentLayer +=1
                     for j in range(self.NX):
                         if (j%self.scatterPeriod == 0):
-                            scatter = random.randint(0,self.scatterMaxValue[currentLayer])
+                            scatter = self.random.randint(0,self.scatterMaxValue[currentLayer])
                         for u in range(scatter):
                             if i-u >= self.NY:
                                 continue
@@ -178,6 +195,65 @@ class layer_models:
         return model
 
 
+    @timing.timed('generate_base')
+    def generate_interfaces(self):
+        """
+        Function that generates layer model as first row of every interface in every column
+        ===
+        - parameters are the same as in generate_base
+        - ----
+        Returns array (layers - 1) x NX
+        """
+        self.__prepare_base()
+
+        if (self.smoothness):
+            return smooth_interfaces(self.NY, self.NX, self.layerThickness, len(self.layerValues), self.scatterAmount, self.columns)
+        elif self.sole:
+            return sole_interfaces(self.NY, self.NX, self.sole, len(self.layerValues), self.npRandom, self.columns)
+        return scatter_interfaces(self.NY, self.NX, self.layerThickness, len(self.layerValues), self.scatterMaxValue, self.scatterPeriod, self.npRandom, self.columns)
+
+
+    def __prepare_base(self):
+        if (len(self.layerThickness) < self.layerCount):
+            val = round(self.npRandom.uniform(self.NY/9, self.NY/6))
+            self.layerThickness = [val]
+            tempsum = val
+            for i in range(self.layerCount - 1):
+                temp2 = self.NY - self.layerThickness[0]
+                temp = round(self.npRandom.uniform(temp2/10, abs((temp2/2.5) * (temp2 - tempsum)/temp2) + temp2/10))
+                self.layerThickness.append(temp)
+                tempsum +=temp
+                if (tempsum > self.NY - self.NY/5):
+                    break
+            while True:
+                if (self.layerCount != len(self.layerThickness)):
+                    index = np.argmax(self.layerThickness)
+                    val = round(self.layerThickness[index]/2)
+                    self.layerThickness[index] = val
+                    self.layerThickness.append(val)
+                else: break
+
+        if (len(self.layerValues) < self.layerCount):
+            self.layerValues = []
+            temp = 1
+            for i in range(self.layerCount):
+                temp += self.random.randint(10, 30)
+                self.layerValues.append(temp)
+
+        self.upperValue = self.layerValues[0]
+        self.downValue = self.layerValues[len(self.layerValues)-1]
+        self.layerValuesSave.append(self.layerValues)
+
+        if (self.smoothness):
+            if not self.scatterAmount:
+                self.scatterAmount = []
+                for i in range(self.random.randint(2,3)):
+                    self.scatterAmount.append(self.random.randint(int(self.NY/10), int(self.NY/5)) * (1 if self.random.random() < 0.5 else -1))
+        elif not self.sole:
+            if (self.scatterMaxValue is not list):
+                self.scatterMaxValue = np.full(shape=self.layerCount,  fill_value = self.scatterMaxValue)
+
+
     def bezier_curves(self, temp, arr):
         y = 0
         temp2 = 1
@@ -190,14 +266,66 @@ class layer_models:
         return y
 
 
+    @timing.timed('gen_slice')
     def gen_slice(self, model, L=None, side = random.randint(0,1), shiftType=random.randint(0,1), Y=None, shiftForce = 15, iterationCount=0):
         columns = len(model[0])
         rows = len(model)
 
         if shiftForce == None: shiftForce = 15
 
+        L, Ystart, temp = self.__fault_params(self.NX, rows, L, Y, iterationCount)
+
+        if self.vectorized and shiftForce >= 0:
+            return fault_shift(model, temp, Ystart, L, side, shiftType, shiftForce, self.upperValue, self.downValue, self.columns)
+
+        columnIndex = range(columns) if self.columns is None else self.columns
+        for i in (range(columns) if shiftType else reversed(range(columns))):
+            de2 = temp * (columnIndex[i] - Ystart)
+            for j in (range(rows) if shiftType else reversed(range(rows))):
+                if ((side and ((de2 >= j and L>=0) or (de2<=j and L<0))) or (not side and ((de2 >= j and L<=0) or (de2<=j and L>0)))):
+                    if (shiftType):
+                        if (j + shiftForce < rows):
+                            model[j][i] = model[j + shiftForce][i]
+                        else:
+                            model[j][i] = self.downValue
+                    else: 
+                        if (j - shiftForce > -1):
+                            model[j][i] = model[j - shiftForce][i]
+                        else:
+                            model[j][i] = self.upperValue
+        return model
+
+
+    @timing.timed('gen_slice')
+    def slice_interfaces(self, interfaces, L=None, side=0, shiftType=0, Y=None, shiftForce=15, iterationCount=0):
+        """
+        Function that applies geological fault to result of generate_interfaces (same parameters as gen_slice)
+        """
+        if shiftForce == None: shiftForce = 15
+
+        L, Ystart, temp = self.__fault_params(self.NX, self.NY, L, Y, iterationCount)
+        if self.faultSave is not None:
+            # interfaces of a faulted column are not enough to rasterize it, boundary_models applies the fault again
+            self.faultSave.append((interfaces, temp, Ystart, L, side, shiftType, shiftForce))
+        return fault_shift_interfaces(interfaces, self.NY, temp, Ystart, L, side, shiftType, shiftForce, self.columns)
+
+
+    @timing.timed('gen_slice')
+    def compose_slice(self, source, L=None, side=0, shiftType=0, Y=None, shiftForce=15, iterationCount=0):
+        """
+        Function that adds geological fault to the map of source rows (same parameters as gen_slice)
+        ===
+        - source - row of the base model that every cell reads (see engine.fault_source)
+        """
+        if shiftForce == None: shiftForce = 15
+
+        L, Ystart, temp = self.__fault_params(self.NX, self.NY, L, Y, iterationCount)
+        return fault_source(source, temp, Ystart, L, side, shiftType, shiftForce, self.columns)
+
+
+    def __fault_params(self, columns, rows, L, Y, iterationCount):
         if Y == None:
-            Y = np.random.uniform((columns/2) - (columns/100)*20, (columns/2) + (columns/100)*20)  
+            Y = self.npRandom.uniform((columns/2) - (columns/100)*20, (columns/2) + (columns/100)*20)  
 
         Ystart = -((math.tan(math.radians(L)) * rows/2) - Y)
 
@@ -221,23 +349,7 @@ class layer_models:
         else:
             self.LSave.append(L)
             self.YstartSave.append(Ystart)
-            
-
-        for i in (range(columns) if shiftType else reversed(range(columns))):
-            de2 = temp * (i - Ystart)
-            for j in (range(rows) if shiftType else reversed(range(rows))):
-                if ((side and ((de2 >= j and L>=0) or (de2<=j and L<0))) or (not side and ((de2 >= j and L<=0) or (de2<=j and L>0)))):
-                    if (shiftType):
-                        if (j + shiftForce < rows):
-                            model[j][i] = model[j + shiftForce][i]
-                        else:
-                            model[j][i] = self.downValue
-                    else: 
-                        if (j - shiftForce > -1):
-                            model[j][i] = model[j - shiftForce][i]
-                        else:
-                            model[j][i] = self.upperValue
-        return model
+        return L, Ystart, temp
 
 
     def __params_validation(self, layerCount, layerThickness, layerValues):
@@ -262,57 +374,295 @@ class layer_models:
 
     def __gen_models(self):
         models = []
+        timing.count('models', self.N)
+        timing.count('cells', self.N * self.NY * self.width)
+
+        if self.boundary:
+            self.faultSave = []
+            self.interfaces = [self.__gen_model() for o in range(self.N)]
+            faults, self.faultSave = self.faultSave, None
+            return boundary_models(self.interfaces, self.layerValuesSave, self.NY, faults, self.columns)
+
+        if self.compact:
+            self.layerIndices = np.empty(shape=(self.N, self.NY, self.width), dtype=self.__index_dtype())
+
+        if self.multiprocess and not self.keepBase:
+            with timing.stage('gen_models_parallel'):
+                models = self.__gen_models_parallel()
+        elif self.__batch_size():
+            models = self.__gen_models_batched()
+        else:
+            for o in range(self.N):
+                model = self.__gen_model()
+                if self.compact:
+                    self.layerIndices[o] = layer_indices(model, self.layerValuesSave[o])
+                else:
+                    models.append(model)
+
+        if self.compact:
+            models = compact_models(self.layerIndices, self.layerValuesSave)
+        return models
+
+
+    def __gen_model(self):
+        model = self.generate_interfaces() if self.boundary else self.generate_base()
+        if self.keepBase and not self.lazy:
+            self.bases.append(model.copy())
+        return self.__slice_model(model)
+
+
+    def __slice_model(self, model):
+        shift = self.slice_interfaces if self.boundary else self.gen_slice
+        if self.withoutShift:
+            return model
+
+        compose = self.__composed()
+        target = model
+        if compose:
+            target = np.repeat(np.arange(self.NY, dtype=np.int16 if self.NY < 32000 else np.int32)[:, None], model.shape[1], axis=1)
+            shift = self.compose_slice
+
+        for i in range(self.shiftCount):
+            Ytemp = self.npRandom.uniform(self.Y[i][0], self.Y[i][1])
+            shiftForceTemp = self.random.randint(self.shiftForce[i][0],self.shiftForce[i][1])
+            Ltemp = self.npRandom.uniform(self.L[i][0], self.L[i][1])
+            target = shift(target, side=self.side[i], shiftType=self.shiftType[i], Y=Ytemp, L=Ltemp, shiftForce=shiftForceTemp, iterationCount=i)
+
+        if compose:
+            return apply_source(model, target, self.upperValue, self.downValue)
+        return target
+
+
+    def reslice(self, Y=None, L=None, shiftForce=None, side=None, shiftType=None, shiftCount=None, withoutShift=None):
+        """
+        Function that applies new faults to the kept models (keepBase) without generating them again
+        ===
+        - parameters are the same as in layer_models (None = keep current value)
+        - ----
+        Fault parameters are drawn from a new generator made from seed, so same seed = same result
+        """
+        if not self.keepBase or len(self.bases) != self.N:
+            raise ValueError('reslice needs models generated with keepBase')
+
+        values = {'Y': Y, 'L': L, 'shiftForce': shiftForce, 'side': side, 'shiftType': shiftType,
+                  'shiftCount': shiftCount, 'withoutShift': withoutShift}
+        values = {name: getattr(self, name) if value is None else value for name, value in values.items()}
+        if (self.boundary and not values['withoutShift']
+                and (values['shiftCount'] > 1 or (values['shiftCount'] == 1 and values['shiftForce'][0][0] < 0))):
+            raise ValueError('boundary models support only one fault with shiftForce >= 0, generate them without boundary')
+        for name, value in values.items():
+            setattr(self, name, value)
+
+        self.random = random.Random(self.seed)
+        self.npRandom = np.random.default_rng(self.seed)
+        self.LSave = []
+        self.YstartSave = []
 
-        if not self.multiprocess:
+        self.faultSave = [] if self.boundary else None
+        models = [self.__slice_model(base.copy()) for base in self.bases]
+        if self.boundary:
+            self.interfaces = models
+            faults, self.faultSave = self.faultSave, None
+            self.models = boundary_models(self.interfaces, self.layerValuesSave, self.NY, faults, self.columns)
+        elif self.compact:
+            self.layerIndices = np.empty_like(self.layerIndices)
             for o in range(self.N):
-                model = self.generate_base()
-                if not self.withoutShift:
-                    for i in range(self.shiftCount):
-                        Ytemp = np.random.uniform(self.Y[i][0], self.Y[i][1])
-                        shiftForceTemp = random.randint(self.shiftForce[i][0],self.shiftForce[i][1])
-                        Ltemp = np.random.uniform(self.L[i][0], self.L[i][1])
-                        model = self.gen_slice(model, side=self.side[i], shiftType=self.shiftType[i], Y=Ytemp, L=Ltemp, shiftForce=shiftForceTemp, iterationCount=i)
-                models.append(model)
+                self.layerIndices[o] = layer_indices(models[o], self.layerValuesSave[o])
+            self.models = compact_models(self.layerIndices, self.layerValuesSave)
         else:
-            import multiprocessing
-            models = multiprocessing.Manager().list()
-            cores = multiprocessing.cpu_count()
-
-            # if (cores > self.N):
-            #     print('The number of models is less than the number of cores. It is better not to use multiprocessing')
-
-            processes = []
-            calc = self.N // cores
-            diff = self.N % cores
-
-            for i in range(cores):
-                # processes.append(multiprocessing.Process(target=self.multi_sequential, args=(i, models, diff + calc if i == 1 else calc,
-                #                                                                               self.NY, self.NX, layerCount, self.layerThickness, self.layerValues, 
-                #                                                                               self.scatterMaxValue, self.scatterPeriod, self.smoothness, self.Y, self.L, 
-                #                                                                               side, shiftType, shiftForce), daemon=True))
-                processes[i].start()
-
-            for p in processes:
-                p.join()
+            self.models = models
+        return self
+
+
+    def __batch_size(self):
+        # batches are limited to about 8M cells, negative shiftForce is handled only by the per-cell loop
+        if (not self.batched or not self.vectorized or self.boundary or self.keepBase
+                or (not self.withoutShift and self.shiftCount > 0 and min(o[0] for o in self.shiftForce[:self.shiftCount]) < 0)):
+            return 0
+        return max(1, 2**23 // (self.NY * self.width))
+
+
+    def __gen_models_batched(self):
+        size = self.__batch_size()
+        models = []
+        for start in range(0, self.N, size):
+            count = min(size, self.N - start)
+            batch = self.generate_batch(count)
+            if self.compact:
+                self.layerIndices[start:start + count] = layer_indices(batch, self.layerValues)
+            else:
+                models.append(batch)
+        return np.concatenate(models) if models else models
+
+
+    @timing.timed('generate_batch')
+    def generate_batch(self, count):
+        """
+        Function that generates count models with faults as one array (count x NY x NX)
+        ===
+        - count - number of models
+        - ----
+        Parameters are the same as in generate_base and gen_slice, fault parameters are drawn for all models at once
+        """
+        self.__prepare_base()
+        self.layerValuesSave += [self.layerValues] * (count - 1)
+
+        if (self.smoothness):
+            base = smooth_model(self.NY, self.NX, self.layerThickness, self.layerValues, self.scatterAmount, self.columns)
+            models = np.broadcast_to(base, (count, *base.shape)).copy()
+        elif self.sole:
+            models = sole_model(self.NY, self.NX, self.sole, self.layerValues, self.npRandom, self.columns, count)
+        else:
+            models = scatter_model(self.NY, self.NX, self.layerThickness, self.layerValues, self.scatterMaxValue, self.scatterPeriod, self.npRandom, self.columns, count)
+
+        if self.withoutShift or self.shiftCount == 0:
+            return models
+
+        L = np.empty(shape=(self.shiftCount, count))
+        Ystart = np.empty(shape=(self.shiftCount, count))
+        for i in range(self.shiftCount):
+            Y = self.npRandom.uniform(self.Y[i][0], self.Y[i][1], size=count)
+            shiftForce = self.npRandom.integers(self.shiftForce[i][0], self.shiftForce[i][1] + 1, size=count)
+            L[i] = self.npRandom.uniform(self.L[i][0], self.L[i][1], size=count)
+
+            Ystart[i] = np.clip(-((np.tan(np.radians(L[i])) * self.NY/2) - Y), 0, self.NX)
+            temp = np.tan(np.radians(90 - L[i]))
+            fault_shift_batch(models, temp, Ystart[i], L[i], self.side[i], self.shiftType[i], shiftForce, self.upperValue, self.downValue, self.columns)
+
+        if (self.shiftCount > 1):
+            self.LSave += L.T.tolist()
+            self.YstartSave += Ystart.T.tolist()
+        else:
+            self.LSave += L[0].tolist()
+            self.YstartSave += Ystart[0].tolist()
         return models
 
 
-    def multi_sequential(self, index, models, calc, NY, NX, layerCount, layerThickness, layerValues,
-                          scatterMaxValue, scatterPeriod, smoothness, Y, L, side, shiftType, shiftForce):
-        # print(f"Запускаем поток № {index}")
-        isDefault = [shiftForce if type(shiftForce)==list else 1 if type(shiftForce)==int else 0,
-                     True if layerCount else False,
-                     True if L else False] 
-        
-        for i in range(calc):
-            layerCount = layerCount if isDefault[1] else random.randint(3,6)
-            L = L if isDefault[2] else random.randint(-45, 45)
-            shiftForce = random.randint(isDefault[0][0], isDefault[0][1]) if type(isDefault[0])==list else shiftForce if isDefault[0] == 1 else random.randint(6,12)
+    def __composed(self):
+        # negative shiftForce is handled only by the per-cell loop
+        return (self.composeFaults and self.vectorized and not self.boundary and self.shiftCount > 1
+                and min(o[0] for o in self.shiftForce[:self.shiftCount]) >= 0)
+
+
+    def iter_models(self, skipLast=False, step=2, chunk=None, withModels=True):
+        """
+        Generator that yields N models one by one without keeping them
+        ===
+        - skipLast - same as in save_to_param
+        - step - same as in save_to_param
+        - chunk - yield lists of chunk items instead of single items
+        - withModels - yield models (False = model is None, boundary models are not rasterized)
+        - ----
+        Every item is (model, L, Ystart, layerValues, params) where params is the save_to_param row
+        """
+        table = self.__depth_table()
+        saves = (self.LSave, self.YstartSave, self.layerValuesSave)
+        items = []
+        try:
+            for o in range(self.N):
+                self.LSave, self.YstartSave, self.layerValuesSave = [], [], []
+                self.faultSave = [] if self.boundary else None
+                model = self.__gen_model()
+                layerValues = self.layerValuesSave[0]
+                L = self.LSave[0] if self.LSave else None
+                Ystart = self.YstartSave[0] if self.YstartSave else None
+                if self.boundary:
+                    thickness = self.__interfaces_thickness(model, layerValues, table, skipLast, step)
+                    if withModels:
+                        model = boundary_models([model], [layerValues], self.NY, self.faultSave, self.columns).model(0)
+                else:
+                    thickness = self.__thickness(layer_indices(model, layerValues), layerValues, table, skipLast, step)
+                params = self.__param_row(thickness, L, Ystart)
+                if not withModels:
+                    model = None
+
+                if chunk is None:
+                    yield model, L, Ystart, layerValues, params
+                    continue
+                items.append((model, L, Ystart, layerValues, params))
+                if len(items) == chunk:
+                    yield items
+                    items = []
+            if items:
+                yield items
+        finally:
+            self.LSave, self.YstartSave, self.layerValuesSave = saves
+            self.faultSave = None
+
+
+    def iter_params(self, skipLast=False, step=2, chunk=None):
+        """
+        Generator that yields save_to_param rows of N models one by one without keeping models
+        ===
+        - skipLast - same as in save_to_param
+        - step - same as in save_to_param
+        - chunk - yield lists of chunk rows instead of single rows
+        """
+        for item in self.iter_models(skipLast, step, chunk, withModels=False):
+            if chunk is None:
+                yield item[4]
+            else:
+                yield [o[4] for o in item]
 
-            model = self.generate_base(layerCount, NY, NX, layerThickness, layerValues, scatterMaxValue, scatterPeriod, smoothness)
-            model = self.gen_slice(model, Y, L, shiftForce, side = side if side is None else random.randint(0,1), shiftType = shiftType if shiftType is None else random.randint(0,1))
-            models.append(model)
-        # print(f"{calc} циклов вычислений закончены. Процессор № {index}")
+
+    def __index_dtype(self):
+        return np.uint8 if max(self.layerCount, len(self.layerValues)) <= 256 else np.uint16
+
+
+    def __gen_models_parallel(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import shared_memory
+
+        cores = min(self.workers or multiprocessing.cpu_count(), self.N)
+        calc = self.N // cores
+        diff = self.N % cores
+        counts = [calc + 1 if i < diff else calc for i in range(cores)]
+        seeds = [int(o.generate_state(1)[0]) for o in np.random.SeedSequence(self.seed).spawn(cores)]
+
+        # layer stack is drawn once here, so all workers make models with the same thickness and values
+        self.__prepare_base()
+        self.layerValuesSave.pop()
+        params = self.__worker_params()
+
+        models = []
+        shape = (self.N, self.NY, self.width)
+        dtype = np.dtype(self.__index_dtype() if self.compact else np.float64)
+        shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        try:
+            with ProcessPoolExecutor(max_workers=cores) as pool:
+                futures = []
+                start = 0
+                for i in range(cores):
+                    futures.append(pool.submit(multi_sequential, params, start, counts[i], shm.name, shape, dtype, seeds[i]))
+                    start += counts[i]
+
+                # results are collected in submission order so saves stay aligned with models
+                for future in futures:
+                    LSave, YstartSave, layerValuesSave = future.result()
+                    self.LSave += LSave
+                    self.YstartSave += YstartSave
+                    self.layerValuesSave += layerValuesSave
+
+            buffer = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            if self.compact:
+                self.layerIndices[:] = buffer
+            else:
+                models = list(buffer.copy())
+            del buffer
+        finally:
+            shm.close()
+            shm.unlink()
+        return models
+
+
+    def __worker_params(self):
+        return dict(NY=self.NY, NX=self.NX, layerCount=self.layerCount, layerThickness=self.layerThickness,
+                    layerValues=self.layerValues, scatterMaxValue=self.scatterMaxValue, scatterPeriod=self.scatterPeriod,
+                    smoothness=self.smoothness, Y=self.Y, L=self.L, shiftForce=self.shiftForce, side=self.side,
+                    shiftType=self.shiftType, shiftCount=self.shiftCount, scatterAmount=self.scatterAmount, sole=self.sole,
+                    withoutShift=self.withoutShift, vectorized=self.vectorized, compact=self.compact, columnStep=self.columnStep,
+                    composeFaults=self.composeFaults, batched=self.batched)
 
 
     def show(self, limit=9, cmap='viridis'):
@@ -322,57 +672,69 @@ class layer_models:
         - limit - models limit
         - cmap - Colormap
         """
+        # matplotlib is imported only here, so the web workers do not load it
+        import matplotlib.pyplot as plt
 
-        if (len(self.models) > limit):
-            self.models = self.models[:limit]
+        models = self.models[:limit]
 
-        if len(self.models) == 1:
+        if len(models) == 1:
             figure, axis = plt.subplots(1, 1)
 
-            axis.imshow(self.models[0], cmap)
+            axis.imshow(models[0], cmap)
 
             plt.show()
             return
-        elif len(self.models) == 2:
+        elif len(models) == 2:
             figure, axis = plt.subplots(1, 2)
-            axis[0].imshow(self.models[0], cmap)
-            axis[1].imshow(self.models[1], cmap)
+            axis[0].imshow(models[0], cmap)
+            axis[1].imshow(models[1], cmap)
 
             plt.show()
             return
         
-        up =  math.ceil(len(self.models)**0.5)
-        low =  round(len(self.models)**0.5)
+        up =  math.ceil(len(models)**0.5)
+        low =  round(len(models)**0.5)
 
         figure, axis = plt.subplots(low, up)
         
-        for i in range(len(self.models)):
-            axis[i//up, i%up].imshow(self.models[i], cmap)
+        for i in range(len(models)):
+            axis[i//up, i%up].imshow(models[i], cmap)
 
         plt.show()
 
+    def __model_indices(self, o):
+        if self.compact:
+            return self.layerIndices[o]
+        return layer_indices(self.models[o], self.layerValuesSave[o])
+
     def save(self, name='data.csv', skipLast = False, step=2, prefix=''):
         y = 0.02
         f = open(name, 'a', newline='')
         writer = csv.writer(f)
+        if self.vectorized or self.compact:
+            table = depth_table(self.NY, y)
         for o in range(len(self.models)):
-            modelsThiknes = []
-            for i in range(len(self.models[0][0])):
-                if i%step:
-                    continue
-                counter = 0
-                layercounter = 0
-                thikness = []
-                for j in range(len(self.models[0])):
-                    if (self.models[o][j][i] != self.layerValuesSave[o][layercounter]):
-                        if (self.layerValuesSave[o].index(self.models[o][j][i]) >= layercounter):
-                            thikness.append(counter)
-                            layercounter += 1
-                    counter += y
-                if (not skipLast):
-                    thikness.append(counter)
-                modelsThiknes.append(thikness)
-            modelsThiknes = np.transpose(modelsThiknes)
+            if self.vectorized or self.compact:
+                indices = self.__model_indices(o)
+                modelsThiknes = model_thickness(indices, len(self.layerValuesSave[o]) - 1, table, skipLast, self.__column_step(step), sequential=True)
+            else:
+                modelsThiknes = []
+                for i in range(len(self.models[0][0])):
+                    if i%step:
+                        continue
+                    counter = 0
+                    layercounter = 0
+                    thikness = []
+                    for j in range(len(self.models[0])):
+                        if (self.models[o][j][i] != self.layerValuesSave[o][layercounter]):
+                            if (self.layerValuesSave[o].index(self.models[o][j][i]) >= layercounter):
+                                thikness.append(counter)
+                                layercounter += 1
+                        counter += y
+                    if (not skipLast):
+                        thikness.append(counter)
+                    modelsThiknes.append(thikness)
+                modelsThiknes = np.transpose(modelsThiknes)
 
             if (not self.LSave):
                 writer.writerow([*modelsThiknes[0], *modelsThiknes[1], *modelsThiknes[2], prefix, 'nan', 'nan', 'nan', 'nan'])
@@ -383,44 +745,198 @@ class layer_models:
         f.close()
         return
     
+    def __depth_table(self):
+        roundPoint = Decimal(str(self.metricPerCell)).as_tuple().exponent*(-1)
+        return depth_table(self.NY, self.metricPerCell, roundPoint)
+
+    def __thickness(self, indices, layerValues, table, skipLast, step):
+        count = layerValues.index(max(layerValues))
+        return model_thickness(indices, count, table, skipLast, self.__column_step(step)).ravel().tolist()
+
+    def __interfaces_thickness(self, interfaces, layerValues, table, skipLast, step):
+        count = layerValues.index(max(layerValues))
+        return interfaces_thickness(interfaces[:count], table, skipLast, self.__column_step(step)).ravel().tolist()
+
+    def __column_step(self, step):
+        # step is given in columns of the full model
+        if step % self.columnStep:
+            raise ValueError(f'step must be a multiple of columnStep ({self.columnStep})')
+        return step // self.columnStep
+
+    def __param_row(self, modelsThiknesTotal, L, Ystart):
+        if (L is None):
+            return [*modelsThiknesTotal]
+        elif (self.shiftCount == 1):
+            return [*modelsThiknesTotal, round(L, 2), round(Ystart, 2)]
+        tempArr = [*modelsThiknesTotal]
+        for i in range(self.shiftCount):
+            tempArr.append(round(L[i],2))
+            tempArr.append(round(Ystart[i],2))
+        return tempArr
+
+    def save_npy(self, path, skipLast=False, step=2, withModels=False, chunk=256):
+        """
+        Function that appends save_to_param rows (and raw models) to the binary dataset
+        ===
+        - path - dataset directory (see dataset_writer)
+        - skipLast - same as in save_to_param
+        - step - same as in save_to_param
+        - withModels - save raw models too
+        - chunk - number of models written between flushes in lazy mode
+        """
+        if self.lazy:
+            batches = (([o[4] for o in items], [o[0] for o in items]) for items in self.iter_models(skipLast, step, chunk, withModels))
+        else:
+            batches = [(self.save_to_param(skipLast, step), self.models)]
+
+        writer = None
+        for rows, models in batches:
+            if writer is None:
+                writer = dataset_writer(path, self.__param_columns(len(rows[0]), step), (self.NY, self.width) if withModels else None)
+            writer.write(rows, np.asarray(models) if withModels else None)
+            writer.flush()
+        if writer:
+            writer.close()
+
+    def __param_columns(self, width, step):
+        columns = range(0, self.NX, step)
+        faults = 0 if self.withoutShift else self.shiftCount
+        names = []
+        for k in range((width - 2*faults) // len(columns)):
+            names += [f'depth{k}_{i}' for i in columns]
+        if faults == 1:
+            names += ['L', 'Ystart']
+        for i in range(faults if faults > 1 else 0):
+            names += [f'L{i}', f'Ystart{i}']
+        return names
+
+    @timing.timed('save_to_param')
     def save_to_param(self, skipLast = False, step=2):
         y = self.metricPerCell
         roundPoint = Decimal(str(self.metricPerCell)).as_tuple().exponent*(-1)
         result = []
+        if self.vectorized or self.compact or self.boundary:
+            table = self.__depth_table()
         for o in range(len(self.models)):
-            modelsThiknes = []
-            for i in range(len(self.models[0][0])):
-                if i%step:
-                    continue
-                counter = 0
-                layercounter = 0
-                thikness = []
-                for j in range(len(self.models[0])):
-                    if (self.models[o][j][i] != self.layerValuesSave[o][layercounter]):
-                        while (self.layerValuesSave[o].index(self.models[o][j][i]) != layercounter):
-                            thikness.append(round(counter,roundPoint))
+            if self.boundary:
+                modelsThiknesTotal = self.__interfaces_thickness(self.interfaces[o], self.layerValuesSave[o], table, skipLast, step)
+            elif self.vectorized or self.compact:
+                modelsThiknesTotal = self.__thickness(self.__model_indices(o), self.layerValuesSave[o], table, skipLast, step)
+            else:
+                modelsThiknes = []
+                for i in range(len(self.models[0][0])):
+                    if i%step:
+                        continue
+                    counter = 0
+                    layercounter = 0
+                    thikness = []
+                    for j in range(len(self.models[0])):
+                        if (self.models[o][j][i] != self.layerValuesSave[o][layercounter]):
+                            while (self.layerValuesSave[o].index(self.models[o][j][i]) != layercounter):
+                                thikness.append(round(counter,roundPoint))
+                                layercounter += 1
+                        counter += y
+                    if (not skipLast):
+                        thikness.append(round(counter,roundPoint))
+                        while (self.layerValuesSave[o].index(max(self.layerValuesSave[o])) != layercounter):
+                            thikness.append(round(counter, roundPoint))
                             layercounter += 1
-                    counter += y
-                if (not skipLast):
-                    thikness.append(round(counter,roundPoint))
-                    while (self.layerValuesSave[o].index(max(self.layerValuesSave[o])) != layercounter):
-                        thikness.append(round(counter, roundPoint))
-                        layercounter += 1
-                modelsThiknes.append(thikness)
-            modelsThiknes = np.transpose(modelsThiknes)
-
-            modelsThiknesTotal = []
-            for i in range(len(modelsThiknes)):
-                modelsThiknesTotal += modelsThiknes[i].tolist()
+                    modelsThiknes.append(thikness)
+                modelsThiknes = np.transpose(modelsThiknes)
+
+                modelsThiknesTotal = []
+                for i in range(len(modelsThiknes)):
+                    modelsThiknesTotal += modelsThiknes[i].tolist()
 
             if (not self.LSave):
-                result.append([*modelsThiknesTotal])
-            elif (self.shiftCount == 1):
-                result.append([*modelsThiknesTotal, round(self.LSave[o], 2), round(self.YstartSave[o], 2)])
+                result.append(self.__param_row(modelsThiknesTotal, None, None))
             else:
-                tempArr = [*modelsThiknesTotal]
-                for i in range(self.shiftCount):
-                    tempArr.append(round(self.LSave[o][i],2))
-                    tempArr.append(round(self.YstartSave[o][i],2))
-                result.append(tempArr)
-        return result
\ No newline at end of file
+                result.append(self.__param_row(modelsThiknesTotal, self.LSave[o], self.YstartSave[o]))
+        return result
+
+
+class compact_models:
+    def __init__(self, layerIndices, layerValuesSave):
+        """
+        List of models that are made from compact storage on demand
+        ===
+        - layerIndices - layer indices of all models (N x NY x NX)
+        - layerValuesSave - value in every layer of every model (list)
+        """
+        self.layerIndices = layerIndices
+        self.layerValuesSave = layerValuesSave
+
+
+    def __len__(self):
+        return len(self.layerIndices)
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[o] for o in range(*index.indices(len(self)))]
+        return self.model(index)
+
+
+    def __iter__(self):
+        for o in range(len(self)):
+            yield self[o]
+
+
+    def model(self, o):
+        return np.asarray(self.layerValuesSave[o], dtype=np.float64)[self.layerIndices[o]]
+
+
+class boundary_models(compact_models):
+    def __init__(self, interfaces, layerValuesSave, NY, faults=None, columns=None):
+        """
+        List of models that are rasterized from interfaces on demand
+        ===
+        - interfaces - first row of every interface in every column of every model (list)
+        - layerValuesSave - value in every layer of every model (list)
+        - NY - number of rows
+        - faults - (interfaces before fault, temp, Ystart, L, side, shiftType, shiftForce) of every model (None = no faults)
+        - columns - generated columns (see layer_models.columns)
+        """
+        super().__init__(interfaces, layerValuesSave)
+        self.NY = NY
+        self.faults = faults
+        self.columns = columns
+
+
+    def model(self, o):
+        layerValues = self.layerValuesSave[o]
+        if not self.faults:
+            return interfaces_model(self.layerIndices[o], self.NY, layerValues)
+        base, temp, Ystart, L, side, shiftType, shiftForce = self.faults[o]
+        return fault_shift(interfaces_model(base, self.NY, layerValues), temp, Ystart, L, side, shiftType, shiftForce,
+                           layerValues[0], layerValues[-1], self.columns)
+
+
+def multi_sequential(params, start, count, shmName, shape, dtype, seed):
+    """
+    Function that generates part of the models in a worker process
+    ===
+    - params - layer_models parameters
+    - start - index of the first model
+    - count - number of models
+    - shmName - name of the shared memory with all models
+    - shape - shape of all models
+    - dtype - type of the shared memory (layer indices in compact mode)
+    - seed - seed of the worker
+    """
+    from multiprocessing import shared_memory
+
+    part = layer_models(N=count, seed=seed, **params)
+
+    shm = shared_memory.SharedMemory(name=shmName)
+    try:
+        models = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        if part.compact:
+            models[start:start + count] = part.layerIndices
+        else:
+            for i in range(count):
+                models[start + i] = part.models[i]
+        del models
+    finally:
+        shm.close()
+    return part.LSave, part.YstartSave, part.layerValuesSave
@@ -40,9 +40,11 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'backend.jobs',
 ]
 
 MIDDLEWARE = [
+    'backend.timing.timing_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -124,3 +126,43 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Generation results cache (bytes of encoded responses, only requests with seed)
+
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 64 * 1024 * 1024))
+
+
+# Base models kept for fault edits (bytes of models before faults, see baseToken in links.main)
+
+BASE_CACHE_SIZE = int(os.environ.get('BASE_CACHE_SIZE', 256 * 1024 * 1024))
+
+
+# Async endpoint: worker processes, maximum queued + running requests, maximum N per request.
+# async/ frees the worker only under an ASGI server (backend.asgi, for example
+# gunicorn -k uvicorn.workers.UvicornWorker backend.asgi:application). docker-compose runs gunicorn
+# with sync WSGI workers, there the view still holds the worker for the whole generation
+
+GENERATION_WORKERS = int(os.environ.get('GENERATION_WORKERS', os.cpu_count() or 1))
+
+GENERATION_QUEUE_DEPTH = int(os.environ.get('GENERATION_QUEUE_DEPTH', 2 * GENERATION_WORKERS))
+
+GENERATION_MAX_MODELS = int(os.environ.get('GENERATION_MAX_MODELS', 1000))
+
+
+# Generation jobs (see backend/jobs, worker: python manage.py run_jobs): models per chunk, maximum N per job
+
+JOB_CHUNK_SIZE = int(os.environ.get('JOB_CHUNK_SIZE', 1000))
+
+JOB_MAX_MODELS = int(os.environ.get('JOB_MAX_MODELS', 10**7))
+
+# Job is failed after this many deaths of its worker processes (OOM kill, segfault), before that it is queued again
+
+JOB_MAX_CRASHES = int(os.environ.get('JOB_MAX_CRASHES', 3))
+
+
+# Per-stage timing (Server-Timing header, latency histograms at metrics/), metrics/ for non-local clients
+
+TIMING_ENABLED = os.environ.get('TIMING_ENABLED', 'True') == 'True'
+
+METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', 'False') == 'True'
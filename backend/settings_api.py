@@ -0,0 +1,30 @@
+"""
+Django settings for the API-only workers (DJANGO_SETTINGS_MODULE=backend.settings_api)
+
+Same as backend.settings, but without admin, auth, sessions, messages, static files,
+templates and the middleware they need. The API views are csrf_exempt and do not use
+users or sessions, so only the timing and security middleware are kept.
+This makes worker startup and every request cheaper (see benchmarks/startup.py).
+manage.py with backend.settings is still used for admin and migrations.
+"""
+from backend.settings import *
+
+
+INSTALLED_APPS = [
+    'backend.jobs',
+]
+
+MIDDLEWARE = [
+    'backend.timing.timing_middleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'backend.urls_api'
+
+TEMPLATES = []
+
+AUTH_PASSWORD_VALIDATORS = []
+
+# no translated messages are used by the API
+USE_I18N = False
@@ -0,0 +1,203 @@
+from contextlib import nullcontext
+from contextvars import ContextVar
+from threading import Lock
+import functools
+import bisect
+import time
+
+
+# upper bounds of histogram buckets in milliseconds (the last bucket is everything above)
+BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+current = ContextVar('timing', default=None)
+disabled = nullcontext()
+
+
+class request_timings:
+    def __init__(self):
+        """
+        Stage durations and counters of one request
+        ===
+        - stages - {stage: [seconds, calls]} in order of the first call
+        - counts - {name: value}
+        """
+        self.stages = {}
+        self.counts = {}
+
+
+    def add(self, name, seconds):
+        stage = self.stages.setdefault(name, [0.0, 0])
+        stage[0] += seconds
+        stage[1] += 1
+
+
+    def server_timing(self, total=None):
+        """
+        Function that makes Server-Timing header value (durations in milliseconds)
+        """
+        items = [f'{name};dur={seconds*1000:.2f}' for name, (seconds, calls) in self.stages.items()]
+        items += [f'{name};desc={value}' for name, value in self.counts.items()]
+        if total is not None:
+            items.append(f'total;dur={total*1000:.2f}')
+        return ', '.join(items)
+
+
+class stage_timer:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *args):
+        self.timings.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name):
+    """
+    Function that measures a stage of the current request (with stage('generate_base'): ...)
+    ===
+    - name - name of the stage
+    - ----
+    Does nothing if timing is not started for the current request
+    """
+    timings = current.get()
+    if timings is None:
+        return disabled
+    return stage_timer(timings, name)
+
+
+def timed(name):
+    """
+    Decorator that measures every call of the function as a stage (see stage)
+    ===
+    - name - name of the stage
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = current.get()
+            if timings is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.add(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def count(name, value):
+    """
+    Function that adds value to a counter of the current request (models, cells)
+    """
+    timings = current.get()
+    if timings is not None:
+        timings.counts[name] = timings.counts.get(name, 0) + value
+
+
+class latency_histograms:
+    def __init__(self, buckets=BUCKETS):
+        """
+        Latency histograms of every stage and of whole requests
+        ===
+        - buckets - upper bounds of buckets in milliseconds
+        """
+        self.buckets = buckets
+        self.items = {}
+        self.lock = Lock()
+
+
+    def observe(self, name, seconds):
+        ms = seconds * 1000
+        with self.lock:
+            item = self.items.get(name)
+            if item is None:
+                item = self.items[name] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * (len(self.buckets) + 1)}
+            item['count'] += 1
+            item['sum'] += ms
+            item['max'] = max(item['max'], ms)
+            item['buckets'][bisect.bisect_left(self.buckets, ms)] += 1
+
+
+    def snapshot(self):
+        """
+        Function that returns copy of histograms ({name: {count, sum, max, buckets}}, times in milliseconds)
+        """
+        with self.lock:
+            return {'bucketsMs': self.buckets + ['inf'],
+                    'latency': {name: {**item, 'buckets': list(item['buckets'])} for name, item in self.items.items()}}
+
+
+histograms = latency_histograms()
+
+
+class timing_middleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """
+        Middleware that times stages of every request (settings.TIMING_ENABLED)
+        ===
+        Adds Server-Timing header and records latency histograms (see links.metrics),
+        works in the sync (WSGI) and the async (ASGI, links.main_async) chain
+        """
+        from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+        from django.conf import settings
+
+        self.get_response = get_response
+        self.enabled = settings.TIMING_ENABLED
+        self.isAsync = iscoroutinefunction(get_response)
+        if self.isAsync:
+            markcoroutinefunction(self)
+
+
+    def __call__(self, request):
+        if self.isAsync:
+            return self.__acall(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        timings = request_timings()
+        token = current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+
+    async def __acall(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        timings = request_timings()
+        token = current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+
+    def finish(self, request, response, timings, total):
+        # streaming responses are generated after this point, only the stages before the body are known
+        response['Server-Timing'] = timings.server_timing(total)
+
+        # route instead of path, so that jobs/<int:id>/ is one histogram
+        route = request.resolver_match.route if request.resolver_match else 'unmatched'
+        histograms.observe(f'request /{route}', total)
+        for name, (seconds, calls) in timings.stages.items():
+            histograms.observe(name, seconds)
+        return response
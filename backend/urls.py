@@ -1,8 +1,7 @@
 from django.contrib import admin
 from django.urls import path
-import backend.links as links
+from backend.urls_api import urlpatterns as api
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', links.main)
-]
+] + api
@@ -0,0 +1,14 @@
+from django.urls import path
+import backend.links as links
+import backend.jobs.views as jobs
+
+# Маршруты API без admin (используются в settings_api)
+urlpatterns = [
+    path('', links.main),
+    path('async/', links.main_async),
+    path('bulk/', links.main_bulk),
+    path('metrics/', links.metrics),
+    path('jobs/', jobs.submit),
+    path('jobs/<int:id>/', jobs.status),
+    path('jobs/<int:id>/result/', jobs.result)
+]
@@ -0,0 +1,193 @@
+"""
+Seeded equivalence checks of the numpy engine against the per-cell code (vectorized=False)
+===
+python -m benchmarks.equivalence                 - all checks
+python -m benchmarks.equivalence --filter smooth - only checks whose name contains the text
+python -m benchmarks.equivalence --seeds 20      - more seeds per case
+- ----
+Every check generates the same models (same seed) with both engines and compares them exactly.
+Exit code is 1 if some case differs, so later optimizations can not silently change the results.
+"""
+import argparse
+import copy
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from backend.models_genearateor.engine import layer_indices
+from backend.models_genearateor.main import layer_models
+
+
+CHECKS = {}
+
+SIZE = dict(NY=40, NX=60)
+
+
+def check(name):
+    """
+    Decorator that registers a check (function seeds -> list of failed cases)
+    """
+    def decorator(func):
+        CHECKS[name] = func
+        return func
+    return decorator
+
+
+def mode_params(mode, layerCount):
+    """
+    Function that makes layer_models parameters of the generation mode (scatter, smooth or sole)
+    """
+    NY = SIZE['NY']
+    if mode == 'smooth':
+        return dict(smoothness=True, scatterAmount=[NY//8 if i % 2 else -NY//10 for i in range(layerCount - 1)])
+    if mode == 'sole':
+        width = NY // (layerCount + 1)
+        # the per-cell code reads the boundary after the last layer, so it has to be below the model
+        return dict(sole=[[width*i, width*i + width//2] for i in range(1, layerCount)] + [[NY, NY]])
+    return {}
+
+
+def generate(params, **kwargs):
+    # parameter lists are changed by layer_models, every call gets its own copy
+    return layer_models(**copy.deepcopy(params), **kwargs)
+
+
+def same_models(a, b):
+    return len(a.models) == len(b.models) and all(np.array_equal(np.asarray(a.models[o]), np.asarray(b.models[o]))
+                                                  for o in range(len(a.models)))
+
+
+@check('smooth')
+def check_smooth(seeds):
+    # base models of the smooth (bezier) mode
+    failed = []
+    for layerCount in (3, 5):
+        for seed in range(seeds):
+            params = dict(N=2, layerCount=layerCount, seed=seed, withoutShift=True, **SIZE, **mode_params('smooth', layerCount))
+            if not same_models(generate(params, vectorized=True), generate(params, vectorized=False)):
+                failed.append(f'layers={layerCount} seed={seed}')
+    return failed
+
+
+def both_engines(models, func):
+    """
+    Function that calls func(models) with the numpy engine and with the per-cell code
+    ===
+    Same object is used, so both calls get the same models and state (scatter and sole base
+    models of the two engines are drawn from other random streams and can not be compared)
+    """
+    try:
+        models.vectorized = True
+        a = func(models)
+        models.vectorized = False
+        b = func(models)
+    finally:
+        models.vectorized = True
+    return a, b
+
+
+@check('gen_slice')
+def check_gen_slice(seeds):
+    # one fault on the same base model, every mode, both sides and both shift types
+    failed = []
+    for mode in ('scatter', 'smooth', 'sole'):
+        for seed in range(seeds):
+            models = generate(dict(N=1, layerCount=4, seed=seed, lazy=True, **SIZE, **mode_params(mode, 4)))
+            base = models.generate_base()
+            rng = np.random.default_rng(seed)
+            for side in (0, 1):
+                for shiftType in (0, 1):
+                    fault = dict(side=side, shiftType=shiftType, Y=rng.uniform(0.3, 0.7) * SIZE['NX'],
+                                 L=rng.uniform(-40, 40), shiftForce=int(rng.integers(1, 12)))
+                    a, b = both_engines(models, lambda m: m.gen_slice(base.copy(), **fault))
+                    if not np.array_equal(a, np.asarray(b)):
+                        failed.append(f'{mode} seed={seed} {fault}')
+    return failed
+
+
+def monotone(models):
+    # the per-cell save_to_param loops forever on a column that returns to an upper layer
+    return all(np.all(np.diff(layer_indices(np.asarray(models.models[o]), models.layerValuesSave[o]), axis=0) >= 0)
+               for o in range(len(models.models)))
+
+
+def saved_rows(models, skipLast, step):
+    with tempfile.TemporaryDirectory() as path:
+        name = os.path.join(path, 'data.csv')
+        models.save(name=name, skipLast=skipLast, step=step, prefix='check')
+        with open(name) as f:
+            return f.read()
+
+
+@check('save_to_param')
+def check_save_to_param(seeds):
+    # rows of save_to_param and save on the same models, with faults and rounding to metricPerCell
+    failed = []
+    checked = skipped = 0
+    for mode in ('scatter', 'smooth', 'sole'):
+        for shiftCount in (0, 1, 2):
+            for seed in range(seeds):
+                NX = SIZE['NX']
+                params = dict(N=1, layerCount=4, seed=seed, metricPerCell=(1, 0.5, 0.02)[seed % 3], **SIZE, **mode_params(mode, 4),
+                              shiftCount=shiftCount, Y=[[NX*0.3, NX*0.7]] * shiftCount, L=[[-40, 40]] * shiftCount,
+                              shiftForce=[[2, 10]] * shiftCount, side=[o % 2 for o in range(shiftCount)],
+                              shiftType=[(o + seed) % 2 for o in range(shiftCount)])
+                models = generate(params)
+                for skipLast in (False, True):
+                    for step in (1, 2):
+                        name = f'{mode} shiftCount={shiftCount} seed={seed} skipLast={skipLast} step={step}'
+                        a, b = both_engines(models, lambda m: saved_rows(m, skipLast, step))
+                        if a != b:
+                            failed.append(f'save {name}')
+                        if not monotone(models):
+                            skipped += 1
+                            continue
+                        checked += 1
+                        a, b = both_engines(models, lambda m: m.save_to_param(skipLast=skipLast, step=step))
+                        if a != b or [list(map(type, o)) for o in a] != [list(map(type, o)) for o in b]:
+                            failed.append(f'save_to_param {name}')
+    if skipped:
+        # the per-cell result is not defined for them (see monotone)
+        print(f'save_to_param: {checked} cases checked, {skipped} with non-monotone columns are checked only with save')
+    return failed
+
+
+@check('compose')
+def check_compose(seeds):
+    # composeFaults (one gather of the combined source map) against faults applied one by one
+    failed = []
+    NX = SIZE['NX']
+    for mode in ('scatter', 'smooth', 'sole'):
+        for shiftCount in (2, 3):
+            for seed in range(seeds):
+                params = dict(N=2, layerCount=4, seed=seed, **SIZE, **mode_params(mode, 4), shiftCount=shiftCount,
+                              Y=[[NX*0.2, NX*0.8]] * shiftCount, L=[[-40, 40]] * shiftCount, shiftForce=[[1, 12]] * shiftCount,
+                              side=[(o + seed) % 2 for o in range(shiftCount)], shiftType=[o % 2 for o in range(shiftCount)])
+                a, b = generate(params, composeFaults=True), generate(params, composeFaults=False)
+                if not same_models(a, b) or a.save_to_param() != b.save_to_param():
+                    failed.append(f'{mode} shiftCount={shiftCount} seed={seed}')
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='numpy engine equivalence checks')
+    parser.add_argument('--filter', default=None, help='only checks whose name contains the text')
+    parser.add_argument('--seeds', type=int, default=5, help='seeds per case')
+    args = parser.parse_args(argv)
+
+    errors = 0
+    for name, func in CHECKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        failed = func(args.seeds)
+        print(f"{name:<16}{'ok' if not failed else 'FAILED ' + str(len(failed))}")
+        for case in failed:
+            print(f'    {case}')
+        errors += len(failed)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""
+Load test of the generation endpoint (links.main)
+===
+python -m benchmarks.load                                     - in-process (Django test client in threads)
+python -m benchmarks.load --url http://127.0.0.1:80/ --pid PID - running server, PID of the gunicorn master
+python -m benchmarks.load --save results/w4-sync.json --label w4-sync
+python -m benchmarks.load --compare results/w4-sync.json results/w2-gthread.json
+- ----
+Every concurrency level sends --requests requests from --concurrency threads, the payloads
+are a fixed random mix (both generationType values, N, grid size and shiftCount, see MIX).
+Reported: throughput (requests per second), latency percentiles and peak RSS of the worker
+processes (the process and all its children, sampled from /proc while the level runs).
+In-process mode measures one process with threads, for a gunicorn setup start the server
+with the wanted workers / worker class, for example
+    gunicorn -b 127.0.0.1:8000 -w 4 -k gthread --threads 2 backend.wsgi
+and pass --url, --pid and a --label which describes it.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+MIX = dict(generationType=[0, 1], N=[1, 5, 20, 50], size=[(60, 120), (120, 240), (200, 400)], shiftCount=[0, 1, 2, 3])
+LEVELS = [1, 2, 4, 8]
+
+
+def make_payload(rng, generationType, N, size, shiftCount):
+    """
+    Function that makes request body of links.main in the format of the frontend
+    ===
+    - rng - random.Random of the payload mix
+    - generationType - 0 (scatter) or 1 (smooth)
+    - N - number of models
+    - size - (NY, NX)
+    - shiftCount - number of faults
+    """
+    NY, NX = size
+    layerCount = rng.randint(3, 6)
+    return dict(N=N, NY=NY, NX=NX, layerCount=layerCount, layerThickness=[], layerValues=[], metricPerCell=0.5,
+                scatterMaxValue=5, scatterPeriod=5, scatterAmount=[0] + [rng.randint(-NY//15, NY//10) for o in range(layerCount - 1)],
+                generationType=generationType, shiftCount=shiftCount, Y=[[NX*0.3, NX*0.7]] * shiftCount,
+                L=[[-30, 30]] * shiftCount, shiftForce=[[3, 12]] * shiftCount,
+                side=[rng.random() < 0.5 for o in range(shiftCount)], shiftType=[rng.random() < 0.5 for o in range(shiftCount)])
+
+
+def payloads(count, seed=0):
+    """
+    Function that makes the payload mix (same seed = same payloads, so runs are comparable)
+    """
+    rng = random.Random(seed)
+    return [json.dumps(make_payload(rng, *[rng.choice(o) for o in MIX.values()])).encode() for o in range(count)]
+
+
+def process_rss(pid):
+    """
+    Function that returns RSS of the process and all its children in bytes (Linux /proc, 0 if unknown)
+    """
+    total = 0
+    stack = [pid]
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+            for task in os.listdir(f'/proc/{pid}/task'):
+                with open(f'/proc/{pid}/task/{task}/children') as f:
+                    stack += [int(o) for o in f.read().split()]
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+class memory_sampler:
+    def __init__(self, pid, interval=0.05):
+        """
+        Thread that keeps the peak RSS of the process tree
+        ===
+        - pid - root process
+        - interval - seconds between samples
+        """
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+
+    def run(self):
+        while True:
+            self.peak = max(self.peak, process_rss(self.pid))
+            if self.stop.wait(self.interval):
+                return
+
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+
+    def __exit__(self, *args):
+        self.stop.set()
+        self.thread.join()
+        return False
+
+
+def inprocess_sender():
+    """
+    Function that makes sender which calls the Django application in this process
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+    from django.test import Client
+
+    local = threading.local()
+
+    def send(body):
+        if not hasattr(local, 'client'):
+            local.client = Client(HTTP_HOST='localhost')
+        response = local.client.post('/', body, content_type='application/json')
+        return response.status_code, len(response.content)
+    return send
+
+
+def http_sender(url, timeout):
+    """
+    Function that makes sender which posts to a running server
+    """
+    def send(body):
+        request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, 0
+    return send
+
+
+def run_level(send, bodies, concurrency, pid):
+    """
+    Function that sends all bodies from concurrency threads
+    ===
+    - send - sender (body -> (status, bytes))
+    - bodies - request bodies
+    - concurrency - number of threads
+    - pid - process whose memory is measured
+    - ----
+    Returns statistics of the level
+    """
+    latencies = []
+    errors = []
+    received = 0
+
+    def one(body):
+        start = time.perf_counter()
+        try:
+            status, size = send(body)
+        except Exception as e:
+            status, size = type(e).__name__, 0
+        return time.perf_counter() - start, status, size
+
+    with memory_sampler(pid) as memory, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        for elapsed, status, size in pool.map(one, bodies):
+            if status == 200:
+                latencies.append(elapsed)
+                received += size
+            else:
+                errors.append(status)
+        elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {'concurrency': concurrency, 'requests': len(bodies), 'errors': len(errors),
+            'errorStatuses': sorted({str(o) for o in errors}), 'seconds': elapsed,
+            'throughput': len(latencies) / elapsed, 'mbPerSecond': received / elapsed / 2**20,
+            'p50': float(np.percentile(ms, 50)), 'p95': float(np.percentile(ms, 95)), 'p99': float(np.percentile(ms, 99)),
+            'mean': float(ms.mean()), 'max': float(ms.max()), 'rssPeakMB': memory.peak / 2**20}
+
+
+def print_levels(label, levels):
+    print(f"{label}")
+    print(f"{'concurrency':>12}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'RSS MB':>9}")
+    for o in levels:
+        print(f"{o['concurrency']:>12}{o['throughput']:>9.2f}{o['p50']:>10.1f}{o['p95']:>10.1f}{o['p99']:>10.1f}"
+              f"{o['errors']:>8}{o['rssPeakMB']:>9.0f}")
+
+
+def compare(files):
+    """
+    Function that prints saved results side by side (throughput and p95 for every concurrency)
+    """
+    runs = []
+    for name in files:
+        with open(name) as f:
+            runs.append(json.load(f))
+    levels = sorted({o['concurrency'] for run in runs for o in run['levels']})
+
+    print(f"{'run':<28}" + ''.join(f"{f'c={c} req/s':>13}{'p95':>9}" for c in levels) + f"{'RSS MB':>9}")
+    for run in runs:
+        byLevel = {o['concurrency']: o for o in run['levels']}
+        line = f"{run['label'][:27]:<28}"
+        for c in levels:
+            o = byLevel.get(c)
+            line += f"{o['throughput']:>13.2f}{o['p95']:>9.1f}" if o else f"{'-':>13}{'-':>9}"
+        print(line + f"{max(o['rssPeakMB'] for o in run['levels']):>9.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='load test of the generation endpoint')
+    parser.add_argument('--url', default=None, help='server url, in-process if not set')
+    parser.add_argument('--pid', type=int, default=None, help='server process for memory (gunicorn master), this process if not set')
+    parser.add_argument('--concurrency', default=','.join(map(str, LEVELS)), help='comma separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=40, help='requests per concurrency level')
+    parser.add_argument('--warmup', type=int, default=2, help='requests before the first level (not measured)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the payload mix')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--label', default=None, help='name of the setup, for example w4-gthread')
+    parser.add_argument('--save', default=None, help='write results to the JSON file')
+    parser.add_argument('--compare', nargs='+', default=None, help='print saved results side by side')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(args.compare)
+        return 0
+
+    send = http_sender(args.url, args.timeout) if args.url else inprocess_sender()
+    pid = args.pid or os.getpid()
+    bodies = payloads(args.requests, args.seed)
+    for body in bodies[:args.warmup]:
+        send(body)
+
+    levels = [run_level(send, bodies, int(o), pid) for o in args.concurrency.split(',')]
+    label = args.label or (args.url or 'in-process')
+    print_levels(label, levels)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump({'label': label, 'target': args.url or 'in-process', 'seed': args.seed, 'mix': MIX,
+                       'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                       'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'levels': levels}, f, indent=1)
+        print(f'results saved to {args.save}')
+
+    return 1 if any(o['errors'] for o in levels) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""
+Benchmarks of the layer_models pipeline (offline, fixed seeds)
+===
+python -m benchmarks.run                  - quick sweep, compare with benchmarks/baseline.json
+python -m benchmarks.run --sweep full     - bigger sweep
+python -m benchmarks.run --save           - write results as the new baseline
+python -m benchmarks.run --filter smooth  - only cases whose name contains the text
+- ----
+Stages: generate_base (N models), gen_slice (shiftCount faults of N models),
+gen_models (layer_models constructor), save_to_param.
+Time is the best of --repeat runs, peak is the memory allocated by the stage (tracemalloc).
+Times are compared after scaling by a calibration loop that runs before every case,
+so a baseline from another machine (or a busy machine) is still usable.
+Exit code is 1 if some stage is slower or bigger than baseline * --threshold.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from backend.models_genearateor.main import layer_models
+from benchmarks.equivalence import monotone
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+SWEEPS = {
+    'quick': dict(mode=['smooth', 'sole', 'scatter'], N=[20], size=[(60, 120), (200, 400)], layerCount=[3, 6],
+                  shiftCount=[1, 3], step=[1, 4]),
+    'full': dict(mode=['smooth', 'sole', 'scatter'], N=[20, 200], size=[(60, 120), (200, 400), (500, 1000)],
+                 layerCount=[3, 6, 10], shiftCount=[1, 2, 4], step=[1, 2, 8]),
+}
+
+# differences below this are noise of the timer
+MIN_TIME_DIFF = 0.005
+MIN_PEAK_DIFF = 64 * 1024
+
+
+def calibrate(repeat=3):
+    """
+    Function that measures speed of the machine on a fixed numpy + python workload (seconds)
+    """
+    rng = np.random.default_rng(0)
+    data = rng.random((400, 400))
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(5):
+            np.take(data, rng.integers(0, 400, 400), axis=0).cumsum(axis=0)
+        sum(k * 0.5 for k in range(50000))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def case_params(mode, N, size, layerCount, shiftCount, seed=0):
+    """
+    Function that makes layer_models parameters of the case
+    ===
+    - mode - smooth, sole or scatter
+    - N - number of models
+    - size - (NY, NX)
+    - layerCount - number of layers
+    - shiftCount - number of faults
+    - seed - seed of the models
+    """
+    NY, NX = size
+    params = dict(N=N, NY=NY, NX=NX, layerCount=layerCount, seed=seed, shiftCount=shiftCount,
+                  Y=[[NX*0.4, NX*0.6]] * shiftCount, L=[[-30, 30]] * shiftCount, shiftForce=[[3, 12]] * shiftCount,
+                  side=[i % 2 for i in range(shiftCount)], shiftType=[(i + 1) % 2 for i in range(shiftCount)])
+    if mode == 'smooth':
+        params.update(smoothness=True, scatterAmount=[NY//10, -NY//15])
+    elif mode == 'sole':
+        width = NY // (layerCount + 1)
+        # the per-cell code (--legacy) reads the boundary after the last layer, so it has to be below the model
+        params.update(sole=[[width*i, width*i + width//2] for i in range(1, layerCount)] + [[NY, NY]])
+    return params
+
+
+def cases(sweep, filter=None):
+    for mode, N, size, layerCount, shiftCount, step in itertools.product(*SWEEPS[sweep].values()):
+        name = f'{mode}-N{N}-{size[0]}x{size[1]}-layers{layerCount}-shifts{shiftCount}-step{step}'
+        if filter and filter not in name:
+            continue
+        yield name, case_params(mode, N, size, layerCount, shiftCount), step
+
+
+def measure(prepare, run, repeat):
+    """
+    Function that measures one stage
+    ===
+    - prepare - function that makes the argument of run (not measured)
+    - run - measured function
+    - repeat - number of runs
+    - ----
+    Returns {'time': best time in seconds, 'peak': peak allocated bytes}
+    """
+    best = None
+    for i in range(repeat):
+        arg = prepare()
+        start = time.perf_counter()
+        run(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    arg = prepare()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        run(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'time': best, 'peak': peak}
+
+
+def bench_case(params, step, repeat, vectorized=True):
+    params = dict(params, vectorized=vectorized)
+    N = params['N']
+
+    def lazy():
+        return layer_models(lazy=True, **params)
+
+    def bases():
+        models = lazy()
+        return models, [models.generate_base() for o in range(N)]
+
+    def slices(arg):
+        models, items = arg
+        for o in range(N):
+            for i in range(models.shiftCount):
+                models.gen_slice(items[o], side=models.side[i], shiftType=models.shiftType[i], Y=sum(models.Y[i]) / 2,
+                                 L=sum(models.L[i]) / 2, shiftForce=models.shiftForce[i][1], iterationCount=i)
+
+    stages = {
+        'generate_base': measure(lazy, lambda models: [models.generate_base() for o in range(N)], repeat),
+        'gen_slice': measure(bases, slices, repeat),
+        'gen_models': measure(lambda: None, lambda arg: layer_models(**params), repeat),
+    }
+    # the per-cell save_to_param loops forever on a column that returns to an upper layer (see equivalence.monotone)
+    if vectorized or monotone(layer_models(**params)):
+        stages['save_to_param'] = measure(lambda: layer_models(**params), lambda models: models.save_to_param(step=step), repeat)
+    return stages
+
+
+def compare(results, baseline, threshold):
+    """
+    Function that finds stages which are worse than baseline
+    ===
+    - results - results of this run ({case: {'calibration': seconds, 'stages': {stage: values}}})
+    - baseline - stored results
+    - threshold - allowed ratio
+    - ----
+    Returns list of (case, stage, metric, baseline value, value)
+    """
+    regressions = []
+    for name, case in results.items():
+        if name not in baseline:
+            continue
+        speed = case['calibration'] / baseline[name]['calibration']
+        for stage, values in case['stages'].items():
+            old = baseline[name]['stages'].get(stage)
+            if old is None:
+                continue
+            for metric, minDiff in (('time', MIN_TIME_DIFF), ('peak', MIN_PEAK_DIFF)):
+                limit = old[metric] * (speed if metric == 'time' else 1.0)
+                if values[metric] > limit * threshold and values[metric] - limit > minDiff:
+                    regressions.append((name, stage, metric, old[metric], values[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='layer_models benchmarks')
+    parser.add_argument('--sweep', choices=SWEEPS, default='quick')
+    parser.add_argument('--filter', default=None, help='only cases whose name contains the text')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='write results to the baseline file')
+    parser.add_argument('--threshold', type=float, default=1.5, help='allowed ratio to the baseline')
+    parser.add_argument('--legacy', action='store_true', help='use per-cell engine (vectorized=False)')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    errors = 0
+    # baseline time is shown scaled to the speed of this run
+    print(f"{'case':<52}{'stage':<15}{'time, ms':>10}{'peak, KB':>11}{'baseline ms':>13}")
+    for name, params, step in cases(args.sweep, args.filter):
+        name = 'legacy-' + name if args.legacy else name
+        try:
+            calibration = calibrate()
+            results[name] = {'calibration': calibration, 'stages': bench_case(params, step, args.repeat, not args.legacy)}
+        except Exception as e:
+            print(f'ERROR {name}: {type(e).__name__}: {e}')
+            errors += 1
+            continue
+        speed = calibration / baseline[name]['calibration'] if name in baseline else 1.0
+        for stage, values in results[name]['stages'].items():
+            old = baseline.get(name, {}).get('stages', {}).get(stage)
+            oldTime = f"{old['time']*speed*1000:.2f}" if old else '-'
+            print(f"{name:<52}{stage:<15}{values['time']*1000:>10.2f}{values['peak']/1024:>11.0f}{oldTime:>13}")
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, stage, metric, old, new in regressions:
+        print(f'REGRESSION {name} {stage} {metric}: {old:.6g} -> {new:.6g}')
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                       'results': baseline}, f, indent=1, sort_keys=True)
+        print(f'baseline saved to {args.baseline}')
+        return 0
+
+    return 1 if regressions or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
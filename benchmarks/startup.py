@@ -0,0 +1,129 @@
+"""
+Benchmark of the worker startup and of the per-request overhead of the Django stack
+===
+python -m benchmarks.startup                        - backend.settings and backend.settings_api
+python -m benchmarks.startup --settings backend.settings_api --repeat 10
+python -m benchmarks.startup --save startup.json
+- ----
+Every run is a new python process (cold start), it measures:
+setup - import django and django.setup() (settings, installed apps),
+application - get_wsgi_application() (middleware chain),
+firstRequest - first POST to links.main (urlconf, views, layer_models imports, one small model),
+request - mean time of GET metrics/ after the first request (middleware + routing, the view is trivial),
+process - the whole child process, measured by the parent (interpreter start included).
+Times are the median of --repeat runs.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+SETTINGS = ['backend.settings', 'backend.settings_api']
+
+BODY = json.dumps(dict(N=1, NY=20, NX=40, layerCount=3, layerThickness=[], layerValues=[], metricPerCell=0.5,
+                       scatterMaxValue=5, scatterPeriod=5, scatterAmount=[0, 2, -2], generationType=0, shiftCount=0,
+                       Y=[], L=[], shiftForce=[], side=[], shiftType=[])).encode()
+
+
+def call(application, method, path, body=b''):
+    """
+    Function that calls the WSGI application without a server, returns status code
+    """
+    environ = {'REQUEST_METHOD': method, 'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': '',
+               'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'REMOTE_ADDR': '127.0.0.1',
+               'SERVER_PROTOCOL': 'HTTP/1.1', 'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+               'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+               'wsgi.version': (1, 0), 'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False}
+    status = []
+    response = application(environ, lambda code, headers, *args: status.append(code))
+    b''.join(response)
+    if hasattr(response, 'close'):
+        response.close()
+    return int(status[0].split()[0])
+
+
+def child(requests):
+    """
+    Function that runs in the child process and prints the measured stages as JSON
+    """
+    result = {}
+    start = time.perf_counter()
+    import django
+    django.setup()
+    result['setup'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    result['application'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    status = call(application, 'POST', '/', BODY)
+    result['firstRequest'] = time.perf_counter() - start
+    if status != 200:
+        raise RuntimeError(f'first request failed with status {status}')
+
+    call(application, 'GET', '/metrics/')
+    start = time.perf_counter()
+    for i in range(requests):
+        call(application, 'GET', '/metrics/')
+    result['request'] = (time.perf_counter() - start) / requests
+
+    result['matplotlib'] = 'matplotlib' in sys.modules
+    result['modules'] = len(sys.modules)
+    print(json.dumps(result))
+
+
+def run(settings, repeat, requests):
+    """
+    Function that starts repeat child processes with the settings module, returns median of every stage
+    """
+    runs = []
+    for i in range(repeat):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings, TIMING_ENABLED='True')
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--child', '--requests', str(requests)],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        elapsed = time.perf_counter() - start
+        runs.append(dict(json.loads(output.strip().splitlines()[-1]), process=elapsed))
+
+    keys = ['setup', 'application', 'firstRequest', 'request', 'process']
+    return {**{o: statistics.median(run[o] for run in runs) for o in keys},
+            'matplotlib': runs[0]['matplotlib'], 'modules': runs[0]['modules']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='worker startup benchmark')
+    parser.add_argument('--settings', nargs='+', default=SETTINGS, help='settings modules to compare')
+    parser.add_argument('--repeat', type=int, default=5, help='cold starts of every settings module')
+    parser.add_argument('--requests', type=int, default=2000, help='requests for the per-request time')
+    parser.add_argument('--save', default=None, help='write results to the JSON file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.requests)
+        return 0
+
+    results = {}
+    print(f"{'settings':<24}{'setup ms':>10}{'app ms':>9}{'first req ms':>14}{'request us':>12}{'process ms':>12}"
+          f"{'modules':>9}  matplotlib")
+    for settings in args.settings:
+        o = results[settings] = run(settings, args.repeat, args.requests)
+        print(f"{settings:<24}{o['setup']*1000:>10.1f}{o['application']*1000:>9.1f}{o['firstRequest']*1000:>14.1f}"
+              f"{o['request']*10**6:>12.1f}{o['process']*1000:>12.1f}{o['modules']:>9}  {o['matplotlib']}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f'results saved to {args.save}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())